@@ -1,15 +1,34 @@
+from warehouse.backends import *
 from warehouse.csv_info import *
+from warehouse.csv_validator import *
+from warehouse.customer_features import *
 from warehouse.database_connection import *
 from warehouse.database_modifier import *
+from warehouse.embedded_connection import *
 from warehouse.load_from_dir import *
+from warehouse.session_funnel import *
+from warehouse.duplicate_analyzer import *
+from warehouse.table_export import *
+from warehouse.sharded_query import *
 from warehouse.utils import *
 
 __all__ = [
     'CSVInfo',
+    'CSVValidator',
+    'CustomerFeatures',
     'DatabaseConnection',
     'DatabaseModifier',
+    'EmbeddedConnection',
     'LoadFromDir',
+    'SessionFunnel',
+    'DuplicateAnalyzer',
+    'TableExporter',
+    'ShardedQuery',
     'check_errors',
+    'connect_from_env',
+    'get_compression',
+    'open_binary',
+    'open_decompressed',
     'timing_decorator',
     'write_to_file',
     'functools',
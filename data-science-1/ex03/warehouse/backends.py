@@ -0,0 +1,39 @@
+import os
+import dotenv
+
+
+def connect_from_env():
+    """
+    Returns the database connection selected by DB_BACKEND:
+    'postgres' (default) connects to the server of DB_HOST/DB_PORT,
+    'sqlite' opens the embedded database file EMBEDDED_DB
+    (warehouse.sqlite by default) and loads the files of
+    CSV_DIRECTORY into it, only on the first run and when they
+    changed since. Its customer table is deduplicated but not
+    fused with the item table. Both expose the same interface.
+
+    Returns:
+    DatabaseConnection or EmbeddedConnection
+    """
+    dotenv.load_dotenv()
+    backend = os.getenv("DB_BACKEND", "postgres").lower()
+
+    if backend == "sqlite":
+        from warehouse.embedded_connection import EmbeddedConnection
+
+        db = EmbeddedConnection(os.getenv("EMBEDDED_DB", "warehouse.sqlite"))
+        db.sync_directory(os.getenv("CSV_DIRECTORY"))
+        return db
+
+    if backend == "postgres":
+        from warehouse.database_connection import DatabaseConnection
+
+        return DatabaseConnection(
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            name=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+        )
+
+    raise ValueError(f"Unknown DB_BACKEND {backend}, choose postgres or sqlite.")
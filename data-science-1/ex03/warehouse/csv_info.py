@@ -1,8 +1,9 @@
 import os
-import pandas as pd
 
 from warehouse.utils import check_errors
 
+UUID_PATTERN = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+
 
 class CSVInfo:
     def __init__(self, filename: str) -> None:
@@ -18,6 +19,7 @@ class CSVInfo:
         types: pd.Series
         rows: int
         size: int
+        cardinality: dict
         """
         self.filename = filename.split("/")[-1].split(".")[0]
         self.data = None
@@ -27,16 +29,61 @@ class CSVInfo:
         self.types = None
         self.rows = None
         self.size = None
+        self.cardinality = None
         self.get_info()
 
     @check_errors(on_off=True)
     def get_info(self):
+        import pandas as pd
+
         self.data = pd.read_csv(self.full_path)
         self.list_of_columns = list(self.data.columns)
         self.columns = len(self.data.columns)
         self.types = self.data.dtypes
         self.rows = len(self.data)
         self.size = os.path.getsize(self.full_path)
+        self.cardinality = self.data.nunique().to_dict()
+
+    def distinct_values(self, column: str) -> list:
+        """
+        Returns the sorted non-null distinct values of a column.
+
+        Args:
+        column: str
+
+        Returns:
+        list
+        """
+        return sorted(self.data[column].dropna().unique().tolist())
+
+    def is_uuid(self, column: str) -> bool:
+        """
+        Checks if every non-null value of a column is a UUID.
+
+        Args:
+        column: str
+
+        Returns:
+        bool
+        """
+        values = self.data[column].dropna().astype(str)
+        return bool(len(values)) and bool(values.str.fullmatch(UUID_PATTERN).all())
+
+    def max_decimals(self, column: str) -> int:
+        """
+        Returns the largest number of decimals used by a numeric column.
+
+        Args:
+        column: str
+
+        Returns:
+        int
+        """
+        values = self.data[column].dropna()
+        for decimals in range(7):
+            if (values.round(decimals) == values).all():
+                return decimals
+        return 7
 
     def print_info(self):
         print(f"File: {self.filename}")
@@ -45,4 +92,5 @@ class CSVInfo:
         print(f"Types: {self.types}")
         print(f"Rows: {self.rows}")
         print(f"Size: {self.size} bytes")
+        print(f"Cardinality: {self.cardinality}")
         print("\n")
@@ -0,0 +1,305 @@
+import os
+import csv
+import hashlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+from warehouse.utils import check_errors, timing_decorator, get_compression, open_binary
+
+
+def split_into_chunks(path: str, chunk_bytes: int) -> list:
+    """
+    Splits a file, after its header line, into byte ranges of
+    about 'chunk_bytes' bytes that start and end on a line
+    boundary.
+
+    Args:
+    path: str
+    chunk_bytes: int
+
+    Returns:
+    list of (start, end) tuples
+    """
+    size = os.path.getsize(path)
+    chunks = []
+    with open(path, 'rb') as file:
+        file.readline()
+        start = file.tell()
+        while start < size:
+            file.seek(min(start + chunk_bytes, size))
+            if file.tell() < size:
+                file.readline()
+            end = file.tell()
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def validate_chunk(path: str, start: int, end: int, columns: list) -> dict:
+    """
+    Reads the byte range [start, end) of a .csv file and returns
+    its row count, content hash, null count per column, number of
+    malformed rows and the min/max of event_time and price.
+
+    Args:
+    path: str
+    start: int
+    end: int
+    columns: list
+
+    Returns:
+    dict
+    """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    return validate_data(data, columns)
+
+
+def validate_data(data: bytes, columns: list) -> dict:
+    """
+    Validates a block of complete .csv lines.
+
+    Args:
+    data: bytes
+    columns: list
+
+    Returns:
+    dict
+    """
+    result = {
+        "rows": 0,
+        "malformed": 0,
+        "hash": hashlib.blake2b(data, digest_size=16).hexdigest(),
+        "nulls": dict.fromkeys(columns, 0),
+        "min": {},
+        "max": {},
+        "last_row_malformed": False,
+        "ends_with_newline": data.endswith(b'\n'),
+    }
+    time_index = columns.index("event_time") if "event_time" in columns else None
+    price_index = columns.index("price") if "price" in columns else None
+
+    for row in csv.reader(data.decode().splitlines()):
+        result["rows"] += 1
+        result["last_row_malformed"] = len(row) != len(columns)
+        if result["last_row_malformed"]:
+            result["malformed"] += 1
+            continue
+        for column, value in zip(columns, row):
+            if value == "":
+                result["nulls"][column] += 1
+        if time_index is not None and row[time_index]:
+            _update_range(result, "event_time", row[time_index])
+        if price_index is not None and row[price_index]:
+            try:
+                _update_range(result, "price", float(row[price_index]))
+            except ValueError:
+                result["malformed"] += 1
+    return result
+
+
+def iter_decompressed_chunks(path: str, chunk_bytes: int):
+    """
+    Decompresses a file as a stream and yields, after its header
+    line, blocks of complete lines cut exactly where
+    split_into_chunks would cut the decompressed file.
+
+    Args:
+    path: str
+    chunk_bytes: int
+
+    Returns:
+    generator of bytes
+    """
+    with open_binary(path) as file:
+        buffer = b''
+        header_skipped = False
+        for block in iter(lambda: file.read(chunk_bytes), b''):
+            buffer += block
+            if not header_skipped:
+                newline = buffer.find(b'\n')
+                if newline == -1:
+                    continue
+                buffer = buffer[newline + 1:]
+                header_skipped = True
+            while len(buffer) > chunk_bytes:
+                newline = buffer.find(b'\n', chunk_bytes)
+                if newline == -1:
+                    break
+                yield buffer[:newline + 1]
+                buffer = buffer[newline + 1:]
+        if buffer and header_skipped:
+            yield buffer
+
+
+def _update_range(result: dict, column: str, value) -> None:
+    if column not in result["min"] or value < result["min"][column]:
+        result["min"][column] = value
+    if column not in result["max"] or value > result["max"][column]:
+        result["max"][column] = value
+
+
+def merge_chunks(results: list, columns: list) -> dict:
+    """
+    Merges the results of the chunks of a file, in file order.
+    The file hash is the hash of the chunk hashes, so it only
+    depends on the file contents and the chunk size. The file is
+    truncated if its last row is malformed or does not end with
+    a newline, as when a download is cut inside the last field.
+
+    Args:
+    results: list
+    columns: list
+
+    Returns:
+    dict
+    """
+    merged = {
+        "rows": 0,
+        "malformed": 0,
+        "nulls": dict.fromkeys(columns, 0),
+        "min": {},
+        "max": {},
+    }
+    digest = hashlib.blake2b(digest_size=16)
+    for result in results:
+        merged["rows"] += result["rows"]
+        merged["malformed"] += result["malformed"]
+        digest.update(result["hash"].encode())
+        for column, nulls in result["nulls"].items():
+            merged["nulls"][column] += nulls
+        for column, value in result["min"].items():
+            _update_range(merged, column, value)
+        for column, value in result["max"].items():
+            _update_range(merged, column, value)
+    merged["hash"] = digest.hexdigest()
+    merged["truncated"] = bool(results) and (results[-1]["last_row_malformed"]
+                                             or not results[-1]["ends_with_newline"])
+    return merged
+
+
+class CSVValidator:
+    """
+    A class that checks a .csv file is complete and well formed
+    before it is loaded. The file is split into line-aligned byte
+    ranges that are validated in parallel in a process pool and
+    merged afterwards. Compressed files cannot be split by byte
+    range, they are decompressed as a stream and their blocks of
+    lines are sent to the pool as they come.
+
+    Attributes:
+    full_path: str
+    filename: str
+    columns: list
+    chunk_bytes: int
+    workers: int
+    result: dict
+
+    Methods:
+    validate: dict
+    is_valid: bool
+    compare_with_table: bool
+    print_report: None
+    """
+    def __init__(self, filename: str, chunk_bytes: int = 1 << 26, workers: int = None):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f'The file {filename} does not exist.')
+        self.full_path = filename
+        self.filename = filename.split("/")[-1].split(".")[0]
+        self.chunk_bytes = chunk_bytes
+        self.workers = workers or os.cpu_count()
+        with open_binary(filename) as file:
+            self.columns = next(csv.reader([file.readline().decode()]), [])
+        self.result = None
+
+    @timing_decorator(msg="Validating CSV")
+    @check_errors(on_off=True)
+    def validate(self) -> dict:
+        """
+        Validates every chunk of the file and merges the results.
+
+        Returns:
+        dict
+        """
+        if get_compression(self.full_path):
+            self.result = merge_chunks(self._validate_stream(), self.columns)
+            return self.result
+
+        chunks = split_into_chunks(self.full_path, self.chunk_bytes)
+        if len(chunks) <= 1 or self.workers == 1:
+            results = [validate_chunk(self.full_path, start, end, self.columns) for start, end in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(
+                    validate_chunk,
+                    [self.full_path] * len(chunks),
+                    [start for start, _ in chunks],
+                    [end for _, end in chunks],
+                    [self.columns] * len(chunks),
+                ))
+        self.result = merge_chunks(results, self.columns)
+        return self.result
+
+    def _validate_stream(self) -> list:
+        """
+        Validates the blocks of a compressed file, keeping at most
+        two blocks per worker in flight to bound the memory used.
+
+        Returns:
+        list
+        """
+        results = []
+        pending = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for data in iter_decompressed_chunks(self.full_path, self.chunk_bytes):
+                pending.append(executor.submit(validate_data, data, self.columns))
+                if len(pending) >= 2 * self.workers:
+                    results.append(pending.pop(0).result())
+            results.extend(future.result() for future in pending)
+        return results
+
+    def is_valid(self) -> bool:
+        """
+        Returns True if the file has rows, is not truncated and
+        has no malformed rows.
+
+        Returns:
+        bool
+        """
+        if self.result is None:
+            self.validate()
+        return self.result["rows"] > 0 and not self.result["truncated"] and self.result["malformed"] == 0
+
+    def compare_with_table(self, db, table_name: str = None) -> bool:
+        """
+        Compares the row count of the file with the row count of
+        the table it was loaded into.
+
+        Args:
+        db: DatabaseConnection
+        table_name: str
+
+        Returns:
+        bool
+        """
+        if self.result is None:
+            self.validate()
+        table_rows = db.get_total_rows(table_name or self.filename)
+        if table_rows != self.result["rows"]:
+            print(f"Row count mismatch for {self.filename}: {self.result['rows']} in file, {table_rows} in table")
+            return False
+        return True
+
+    def print_report(self) -> None:
+        if self.result is None:
+            self.validate()
+        print(f"File: {self.filename}")
+        print(f"Rows: {self.result['rows']}")
+        print(f"Malformed rows: {self.result['malformed']}")
+        print(f"Truncated: {self.result['truncated']}")
+        print(f"Hash: {self.result['hash']}")
+        print(f"Nulls: {self.result['nulls']}")
+        print(f"Min: {self.result['min']}")
+        print(f"Max: {self.result['max']}")
+        print("\n")
@@ -0,0 +1,302 @@
+import io
+
+from warehouse.database_connection import DatabaseConnection
+from warehouse.utils import check_errors, timing_decorator
+
+NUMERIC_FEATURES = [
+    "event_count",
+    "purchase_count",
+    "cart_count",
+    "total_spend",
+    "avg_spend",
+    "cart_to_purchase_ratio",
+]
+
+
+class CustomerFeatures:
+    """
+    A class that maintains a table with one row of features per
+    user_id of the customer table: event, purchase and cart counts,
+    total and average spend, first and last event, cart to purchase
+    ratio and favorite brand and category (the ones the user had
+    the most events with).
+
+    Each update reads only the events newer than the last update,
+    in a single scan, and merges them into the existing features.
+    The brand and category counts per user are kept in two side
+    tables so the favorites stay exact across updates.
+
+    Changes to events already merged (a month reloaded, rows
+    appended at or before the watermark, rows deleted by dedup)
+    are reported by the ingest and dedup stages with mark_stale
+    or check_appended, and the next update rebuilds the features
+    instead, dropping the old ones in the same transaction.
+
+    Attributes:
+    db: DatabaseConnection
+    source_table: str
+    table_name: str
+
+    Methods:
+    build: int
+    update: int
+    mark_stale: None
+    check_appended: bool
+    to_dataframe: pd.DataFrame
+    to_numpy: np.ndarray
+    """
+    def __init__(self, db: DatabaseConnection, source_table: str = "customer", table_name: str = "customer_features"):
+        self.db = db
+        self.source_table = source_table
+        self.table_name = table_name
+        self.brand_table = f"{table_name}_brand"
+        self.category_table = f"{table_name}_category"
+        self.watermark_table = f"{table_name}_watermark"
+        self.stale_table = f"{table_name}_stale"
+
+    def _create_tables(self) -> None:
+        self.db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table_name} (
+                user_id INTEGER PRIMARY KEY,
+                event_count BIGINT NOT NULL DEFAULT 0,
+                purchase_count BIGINT NOT NULL DEFAULT 0,
+                cart_count BIGINT NOT NULL DEFAULT 0,
+                total_spend NUMERIC NOT NULL DEFAULT 0,
+                avg_spend NUMERIC,
+                first_event TIMESTAMP,
+                last_event TIMESTAMP,
+                cart_to_purchase_ratio FLOAT,
+                favorite_brand TEXT,
+                favorite_category TEXT
+            )
+        """)
+        for table, column in ((self.brand_table, "brand"), (self.category_table, "category_code")):
+            self.db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    user_id INTEGER,
+                    {column} TEXT,
+                    events BIGINT NOT NULL,
+                    PRIMARY KEY (user_id, {column})
+                )
+            """)
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS {self.watermark_table} (processed_until TIMESTAMP)")
+
+    def drop(self) -> None:
+        """
+        Drops the features table and its side tables.
+        """
+        for table in (self.table_name, self.brand_table, self.category_table, self.watermark_table,
+                      self.stale_table):
+            self.db.drop_table(table)
+
+    def watermark(self):
+        """
+        Returns the event_time of the newest event already merged
+        into the features, or None if nothing was merged yet.
+
+        Returns:
+        datetime or None
+        """
+        if not self.db.execute(f"SELECT to_regclass('{self.watermark_table}') IS NOT NULL")[0][0]:
+            return None
+        result = self.db.execute(f"SELECT MAX(processed_until) FROM {self.watermark_table}")
+        return result[0][0] if result else None
+
+    def is_stale(self) -> bool:
+        """
+        Checks if events already merged into the features changed
+        since, see mark_stale.
+
+        Returns:
+        bool
+        """
+        if not self.db.execute(f"SELECT to_regclass('{self.stale_table}') IS NOT NULL")[0][0]:
+            return False
+        return bool(self.db.execute(f"SELECT 1 FROM {self.stale_table} LIMIT 1"))
+
+    def mark_stale(self, reason: str) -> None:
+        """
+        Records that events already merged into the features were
+        changed or deleted, so the next update rebuilds them. Does
+        nothing if the features were never built.
+
+        Args:
+        reason: str
+        """
+        if self.watermark() is None:
+            return
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS {self.stale_table} (reason TEXT, marked_at TIMESTAMP)")
+        self.db.execute(f"INSERT INTO {self.stale_table} VALUES (%s, now())", (reason,))
+
+    def check_appended(self, tables: list) -> bool:
+        """
+        Marks the features stale if one of the tables appended to the
+        source table has events at or before the watermark, which an
+        incremental update would skip (a backfilled month, or rows
+        with the watermark's timestamp).
+
+        Args:
+        tables: list
+
+        Returns:
+        bool
+        """
+        watermark = self.watermark()
+        if watermark is None:
+            return False
+        for table in tables:
+            if self.db.execute(f"SELECT EXISTS(SELECT 1 FROM {table} WHERE event_time <= %s)", (watermark,))[0][0]:
+                self.mark_stale(f"{table} has events at or before {watermark}")
+                return True
+        return False
+
+    @timing_decorator(msg="Building Customer Features")
+    @check_errors(on_off=True)
+    def build(self) -> int:
+        """
+        Rebuilds the features from every event of the source table.
+        The old features are dropped in the transaction that builds
+        the new ones, so they are kept if the build fails.
+
+        Returns:
+        int
+        """
+        return self._merge(rebuild=True)
+
+    @timing_decorator(msg="Updating Customer Features")
+    @check_errors(on_off=True)
+    def update(self) -> int:
+        """
+        Merges the events newer than the watermark into the features
+        and returns the number of users updated. The features are
+        rebuilt instead if they were marked stale.
+
+        Returns:
+        int
+        """
+        if self.is_stale():
+            print("Events already merged into the customer features changed, rebuilding them")
+            return self.build()
+        return self._merge(rebuild=False)
+
+    def _merge(self, rebuild: bool) -> int:
+        """
+        Merges the events newer than the watermark (every event when
+        rebuilding) into the features, in one transaction. The new
+        events are aggregated in a single scan with grouping sets:
+        by user, by user and brand and by user and category.
+
+        Args:
+        rebuild: bool
+
+        Returns:
+        int
+        """
+        watermark = None if rebuild else self.watermark()
+        batch = f"{self.table_name}_batch"
+        new_events = "AND event_time > %s" if watermark else ""
+
+        with self.db.transaction():
+            if rebuild:
+                self.drop()
+            self._create_tables()
+            self.db.execute(f"DROP TABLE IF EXISTS {batch}")
+            self.db.execute(f"""
+                CREATE TEMP TABLE {batch} ON COMMIT DROP AS
+                SELECT user_id, brand::text AS brand, category_code::text AS category_code,
+                       GROUPING(brand, category_code) AS level,
+                       COUNT(*) AS event_count,
+                       COUNT(*) FILTER (WHERE event_type = 'purchase') AS purchase_count,
+                       COUNT(*) FILTER (WHERE event_type = 'cart') AS cart_count,
+                       COALESCE(SUM(price) FILTER (WHERE event_type = 'purchase'), 0) AS total_spend,
+                       MIN(event_time) AS first_event,
+                       MAX(event_time) AS last_event
+                FROM {self.source_table}
+                WHERE event_time IS NOT NULL {new_events}
+                GROUP BY GROUPING SETS ((user_id), (user_id, brand), (user_id, category_code))
+            """, (watermark,) if watermark else None)
+
+            self.db.execute(f"""
+                INSERT INTO {self.table_name} AS f
+                    (user_id, event_count, purchase_count, cart_count, total_spend, first_event, last_event)
+                SELECT user_id, event_count, purchase_count, cart_count, total_spend, first_event, last_event
+                FROM {batch}
+                WHERE level = 3 AND user_id IS NOT NULL
+                ON CONFLICT (user_id) DO UPDATE SET
+                    event_count = f.event_count + EXCLUDED.event_count,
+                    purchase_count = f.purchase_count + EXCLUDED.purchase_count,
+                    cart_count = f.cart_count + EXCLUDED.cart_count,
+                    total_spend = f.total_spend + EXCLUDED.total_spend,
+                    first_event = LEAST(f.first_event, EXCLUDED.first_event),
+                    last_event = GREATEST(f.last_event, EXCLUDED.last_event)
+            """)
+
+            for table, column, level in ((self.brand_table, "brand", 1), (self.category_table, "category_code", 2)):
+                self.db.execute(f"""
+                    INSERT INTO {table} AS t (user_id, {column}, events)
+                    SELECT user_id, {column}, event_count
+                    FROM {batch}
+                    WHERE level = {level} AND user_id IS NOT NULL AND {column} IS NOT NULL
+                    ON CONFLICT (user_id, {column}) DO UPDATE SET events = t.events + EXCLUDED.events
+                """)
+
+            self.db.execute(f"""
+                UPDATE {self.table_name} f SET
+                    avg_spend = f.total_spend / NULLIF(f.purchase_count, 0),
+                    cart_to_purchase_ratio = f.cart_count::float / NULLIF(f.purchase_count, 0),
+                    favorite_brand = (
+                        SELECT brand FROM {self.brand_table} b
+                        WHERE b.user_id = f.user_id ORDER BY events DESC, brand LIMIT 1),
+                    favorite_category = (
+                        SELECT category_code FROM {self.category_table} c
+                        WHERE c.user_id = f.user_id ORDER BY events DESC, category_code LIMIT 1)
+                FROM {batch} n
+                WHERE n.level = 3 AND n.user_id = f.user_id
+            """)
+            updated_users = self.db.cursor.rowcount
+
+            self.db.execute(f"""
+                INSERT INTO {self.watermark_table} (processed_until)
+                SELECT MAX(last_event) FROM {batch} WHERE level = 3 HAVING MAX(last_event) IS NOT NULL
+            """)
+
+        print(f"Customer features updated for {updated_users} users")
+        return updated_users
+
+    @check_errors(on_off=True)
+    def to_dataframe(self, columns: list = None):
+        """
+        Exports the features table as a pandas DataFrame indexed
+        by user_id, streamed with COPY instead of fetching rows.
+
+        Args:
+        columns: list
+
+        Returns:
+        pd.DataFrame
+        """
+        import pandas as pd
+
+        selected = ', '.join(['user_id'] + columns) if columns else '*'
+        buffer = io.StringIO()
+        self.db.cursor.copy_expert(
+            f"COPY (SELECT {selected} FROM {self.table_name} ORDER BY user_id) TO STDOUT WITH CSV HEADER", buffer)
+        buffer.seek(0)
+        dates = [column for column in ("first_event", "last_event") if not columns or column in columns]
+        return pd.read_csv(buffer, parse_dates=dates).set_index("user_id")
+
+    def to_numpy(self, columns: list = None):
+        """
+        Exports the numeric features as a float matrix, one row per
+        user_id (in user_id order), ready for clustering. Missing
+        values (for instance the average spend of users without
+        purchases) are NaN.
+
+        Args:
+        columns: list
+
+        Returns:
+        np.ndarray
+        """
+        columns = columns or NUMERIC_FEATURES
+        return self.to_dataframe(columns)[columns].to_numpy(dtype=float)
@@ -1,4 +1,7 @@
 import psycopg2
+import psycopg2.extras
+
+from contextlib import contextmanager
 
 from warehouse.utils import check_errors
 
@@ -12,8 +15,12 @@ class DatabaseConnection:
     cursor: psycopg2.extensions.cursor
 
     Methods:
+    clone: DatabaseConnection
     close: None
     execute: None
+    execute_values: None
+    execute_batch: None
+    transaction: context manager
     fetchall: list
     """
     @check_errors(on_off=True)
@@ -26,8 +33,10 @@ class DatabaseConnection:
             user=user,
             password=password
         )
+        self.params = dict(host=host, port=port, name=name, user=user, password=password)
         self.cursor = self.connection.cursor()
         self.supports_executemany = True
+        self.in_transaction = False
 
     def __enter__(self):
         return self
@@ -35,6 +44,16 @@ class DatabaseConnection:
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
 
+    def clone(self):
+        """
+        Opens a new connection to the same database, for work
+        that runs concurrently on its own backend.
+
+        Returns:
+        DatabaseConnection
+        """
+        return DatabaseConnection(**self.params)
+
     def close(self):
         """
         Closes the cursor and connection to the database.
@@ -56,14 +75,87 @@ class DatabaseConnection:
 
         try:
             self.cursor.execute(query, params)
-            result = self.cursor.fetchall() or None
-        except psycopg2.ProgrammingError:
-            pass
-        finally:
-            self.connection.commit()
+            if self.cursor.description is not None:
+                result = self.cursor.fetchall() or None
+        except Exception:
+            if not self.in_transaction:
+                self.connection.rollback()
+            raise
+        self.commit()
 
         return result
 
+    def commit(self):
+        """
+        Commits the current transaction, unless the statements
+        run inside a transaction() block, which commits once at
+        its end.
+        """
+        if not self.in_transaction:
+            self.connection.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs every statement of the block in a single transaction
+        with a single commit at the end. The transaction is rolled
+        back if the block raises, or if a statement failed inside
+        it, since committing an aborted transaction only rolls it
+        back. Nested blocks join the outer one.
+        """
+        if self.in_transaction:
+            yield self
+            return
+
+        self.in_transaction = True
+        try:
+            yield self
+            if self.connection.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+                raise psycopg2.InternalError("A statement of the transaction failed, it was rolled back.")
+        except Exception:
+            self.connection.rollback()
+            raise
+        else:
+            self.connection.commit()
+        finally:
+            self.in_transaction = False
+
+    def execute_values(self, query: str, rows: list, template: str = None, page_size: int = 1000) -> list or None:
+        """
+        Runs a query with a single VALUES %s placeholder for many
+        rows, sending 'page_size' rows per statement.
+
+        Args:
+        query: str
+        rows: list
+        template: str
+        page_size: int
+
+        Returns:
+        list or None
+        """
+        fetch = 'RETURNING' in query.upper()
+        try:
+            return psycopg2.extras.execute_values(
+                self.cursor, query, rows, template=template, page_size=page_size, fetch=fetch) or None
+        finally:
+            self.commit()
+
+    def execute_batch(self, query: str, rows: list, page_size: int = 100) -> None:
+        """
+        Runs a parameterized query once per row, sending 'page_size'
+        statements per round trip to the server.
+
+        Args:
+        query: str
+        rows: list
+        page_size: int
+        """
+        try:
+            psycopg2.extras.execute_batch(self.cursor, query, rows, page_size=page_size)
+        finally:
+            self.commit()
+
     def get_columns(self, table_name: str) -> list:
         """
         Returns the columns of a table.
@@ -109,5 +201,33 @@ class DatabaseConnection:
         Returns:
         bool
         """
-        return bool(self.execute(
-            f"SELECT EXISTS(SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = '{table_name}');"))
+        return self.execute(
+            f"SELECT EXISTS(SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = '{table_name}');")[0][0]
+
+    def get_column_types(self, table_name: str) -> dict:
+        """
+        Returns the PostgreSQL data type of every column of a table.
+
+        Args:
+        table_name: str
+
+        Returns:
+        dict
+        """
+        result = self.execute(
+            "SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+            "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped ORDER BY attnum",
+            (table_name,))
+        return dict(result or [])
+
+    def type_exists(self, type_name: str) -> bool:
+        """
+        Checks if a data type exists in the database.
+
+        Args:
+        type_name: str
+
+        Returns:
+        bool
+        """
+        return self.execute("SELECT EXISTS(SELECT 1 FROM pg_type WHERE typname = %s)", (type_name,))[0][0]
@@ -1,8 +1,9 @@
-import io
+import os
+import time
 
 from warehouse.csv_info import CSVInfo
 from warehouse.database_connection import DatabaseConnection
-from warehouse.utils import check_errors, timing_decorator, write_to_file
+from warehouse.utils import CSV_TO_POSTGRES_TYPES, check_errors, timing_decorator, write_to_file, open_decompressed
 
 
 class DatabaseModifier:
@@ -11,12 +12,22 @@ class DatabaseModifier:
 
     Attributes:
     db: DatabaseConnection
+    compact_types: bool
+    max_enum_labels: int
+    bulk_load: bool
 
     Methods:
     create_table: None
     """
-    def __init__(self, database: DatabaseConnection):
+    def __init__(self, database: DatabaseConnection, compact_types: bool = False, max_enum_labels: int = 5000,
+                 bulk_load: bool = False):
         self.db = database
+        self.compact_types = compact_types
+        self.max_enum_labels = max_enum_labels
+        self.bulk_load = bulk_load
+        self.unlogged_tables = []
+        self.deferred_indexes = []
+        self.load_stats = {"files": 0, "rows": 0, "bytes": 0, "seconds": 0.0}
 
     @staticmethod
     def _get_data_types(column: str) -> str:
@@ -31,22 +42,232 @@ class DatabaseModifier:
         Returns:
         str
         """
-        csv_to_postgres_types = {
-            "event_time": "TIMESTAMP",
-            "event_type": "VARCHAR(255)",
-            "product_id": "INTEGER",
-            "price": "FLOAT",
-            "user_id": "INTEGER",
-            "user_session": "VARCHAR(255)",
-            "category_id": "BIGINT",
-            "category_code": "VARCHAR(255)",
-            "brand": "VARCHAR(255)",
-        }
-        return csv_to_postgres_types[column]
+        return CSV_TO_POSTGRES_TYPES[column]
+
+    def _get_compact_data_type(self, csv: CSVInfo, column: str) -> str:
+        """
+        Picks a smaller PostgreSQL data type for a column from what
+        the inspection of the .csv file found: low-cardinality
+        strings become enums, UUID strings become UUID and prices
+        with at most two decimals become NUMERIC. Any other column
+        keeps its default data type.
+
+        Args:
+        csv: CSVInfo
+        column: str
+
+        Returns:
+        str
+        """
+        default_type = self._get_data_types(column)
+        if not default_type.startswith("VARCHAR") and default_type != "FLOAT":
+            return default_type
+
+        if default_type == "FLOAT":
+            return "NUMERIC(10, 2)" if csv.max_decimals(column) <= 2 else "REAL"
+
+        if csv.is_uuid(column):
+            return "UUID"
+
+        if 0 < csv.cardinality[column] <= self.max_enum_labels:
+            return self._create_enum(f"{column}_enum", csv.distinct_values(column))
+
+        return default_type
+
+    def _create_enum(self, type_name: str, labels: list) -> str:
+        """
+        Creates an enum type with the given labels, or adds the
+        missing labels to it if it already exists.
+
+        Args:
+        type_name: str
+        labels: list
+
+        Returns:
+        str
+        """
+        quoted_labels = ["'" + str(label).replace("'", "''") + "'" for label in labels]
+        if not self.db.type_exists(type_name):
+            self.db.execute(f"CREATE TYPE {type_name} AS ENUM ({', '.join(quoted_labels)})")
+        else:
+            for label in quoted_labels:
+                self.db.execute(f"ALTER TYPE {type_name} ADD VALUE IF NOT EXISTS {label}")
+        return type_name
+
+    @check_errors(on_off=True)
+    def start_bulk_load(self, work_mem: str = "256MB", maintenance_work_mem: str = "1GB") -> None:
+        """
+        Switches the session to bulk-load settings: more memory for
+        sorts and index builds, and commits that do not wait for the
+        WAL to be flushed. Tables created from now on are UNLOGGED,
+        their autovacuum is disabled and their indexes are only
+        built once the data is loaded, in finish_bulk_load.
+
+        Args:
+        work_mem: str
+        maintenance_work_mem: str
+        """
+        self.bulk_load = True
+        self.db.execute(f"SET work_mem = '{work_mem}'")
+        self.db.execute(f"SET maintenance_work_mem = '{maintenance_work_mem}'")
+        self.db.execute("SET synchronous_commit = off")
+
+    @timing_decorator(msg="Finishing Bulk Load")
+    @check_errors(on_off=True)
+    def finish_bulk_load(self) -> None:
+        """
+        Rebuilds the deferred indexes, converts the UNLOGGED tables
+        to LOGGED, enables their autovacuum again, analyzes them and
+        restores the default session settings. The tables are made
+        LOGGED again even if an index cannot be rebuilt.
+        """
+        try:
+            for index_definition in self.deferred_indexes:
+                self.db.execute(index_definition)
+            self.deferred_indexes = []
+        finally:
+            for table_name in self.unlogged_tables:
+                if self.db.table_exists(table_name):
+                    self.db.execute(f"ALTER TABLE {table_name} SET LOGGED")
+                    self.db.execute(f"ALTER TABLE {table_name} RESET (autovacuum_enabled)")
+                    self.db.execute(f"ANALYZE {table_name}")
+            self.unlogged_tables = []
+
+            self.db.execute("RESET work_mem")
+            self.db.execute("RESET maintenance_work_mem")
+            self.db.execute("RESET synchronous_commit")
+            self.bulk_load = False
+
+    def _create_table_prefix(self, table_name: str) -> str:
+        """
+        Returns 'CREATE TABLE', or 'CREATE UNLOGGED TABLE' in bulk-load
+        mode, in which case the table is tracked to be converted back
+        to LOGGED at the end of the load.
+
+        Args:
+        table_name: str
+
+        Returns:
+        str
+        """
+        if not self.bulk_load:
+            return "CREATE TABLE"
+        if table_name not in self.unlogged_tables:
+            self.unlogged_tables.append(table_name)
+        return "CREATE UNLOGGED TABLE"
+
+    def _defer_indexes(self, table_name: str) -> None:
+        """
+        Drops the indexes of a table that do not back a constraint
+        and keeps their definition to rebuild them after the load.
+        It only matters when loading into an existing indexed table:
+        ingest creates every table it loads (modified files are
+        dropped first) and indexes are only added after the load,
+        so there is nothing to defer in the pipeline itself.
+
+        Args:
+        table_name: str
+        """
+        indexes = self.db.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint)",
+            (table_name,)) or []
+        for index_name, index_definition in indexes:
+            self.db.execute(f"DROP INDEX IF EXISTS {index_name}")
+            self.deferred_indexes.append(index_definition)
+
+    def report_throughput(self) -> dict:
+        """
+        Prints the rows and megabytes per second loaded with COPY
+        so far. See compare_load_modes to measure both modes.
+
+        Returns:
+        dict
+        """
+        stats = dict(self.load_stats)
+        seconds = stats["seconds"] or float("inf")
+        stats["rows_per_second"] = stats["rows"] / seconds
+        stats["mb_per_second"] = stats["bytes"] / 1e6 / seconds
+        mode = "bulk-load" if self.bulk_load else "default"
+        print(f"Loaded {stats['files']} files, {stats['rows']} rows, {stats['bytes'] / 1e6:.2f} MB "
+              f"in {stats['seconds']:.2f} seconds ({mode} mode): "
+              f"{stats['rows_per_second']:.0f} rows/s, {stats['mb_per_second']:.2f} MB/s")
+        return stats
+
+    @timing_decorator(msg="Comparing Load Modes")
+    @check_errors(on_off=True)
+    def compare_load_modes(self, csv: CSVInfo, repeats: int = 2) -> dict:
+        """
+        Loads one file into scratch tables with the default settings
+        and in bulk-load mode, 'repeats' times each, and prints the
+        best throughput of both. The file is read once beforehand so
+        the page cache is warm for every run, and the modes alternate
+        (default, bulk, bulk, default...) so neither always runs
+        first. The bulk load is timed up to the end of
+        finish_bulk_load, so its switch back to LOGGED is counted.
+        The scratch tables are dropped afterwards.
+
+        Args:
+        csv: CSVInfo
+        repeats: int
+
+        Returns:
+        dict
+        """
+        with open_decompressed(csv.full_path) as file:
+            for _ in iter(lambda: file.read(1 << 20), b''):
+                pass
+
+        modes = []
+        for i in range(repeats):
+            modes += ["default", "bulk_load"] if i % 2 == 0 else ["bulk_load", "default"]
+
+        results = {}
+        for mode in modes:
+            seconds, rows = self._time_load(csv, bulk_load=mode == "bulk_load")
+            if mode not in results or seconds < results[mode]["seconds"]:
+                results[mode] = {"rows": rows, "seconds": seconds, "rows_per_second": rows / (seconds or float("inf"))}
+
+        for mode, result in results.items():
+            print(f"{mode}: {result['rows']} rows in {result['seconds']:.2f} seconds, "
+                  f"{result['rows_per_second']:.0f} rows/s (best of {repeats})")
+        if results["bulk_load"]["seconds"]:
+            print(f"Bulk load speedup: {results['default']['seconds'] / results['bulk_load']['seconds']:.2f}x")
+        return results
+
+    def _time_load(self, csv: CSVInfo, bulk_load: bool) -> tuple:
+        """
+        Creates a scratch table, loads a file into it, drops it and
+        returns the seconds the load took and the rows loaded.
+
+        Args:
+        csv: CSVInfo
+        bulk_load: bool
+
+        Returns:
+        tuple
+        """
+        table_name = f"{csv.filename}_{'bulk_load' if bulk_load else 'default'}_bench"
+        modifier = DatabaseModifier(self.db, compact_types=self.compact_types, max_enum_labels=self.max_enum_labels)
+        self.db.drop_table(table_name)
+        start_time = time.time()
+        if bulk_load:
+            modifier.start_bulk_load()
+        try:
+            try:
+                modifier.create_tables_from_csv(csv=csv, table_name=table_name)
+                modifier.load_csv_into_table(csv=csv, table_name=table_name)
+            finally:
+                if bulk_load:
+                    modifier.finish_bulk_load()
+            seconds = time.time() - start_time
+        finally:
+            self.db.drop_table(table_name)
+        return seconds, modifier.load_stats["rows"]
 
     @timing_decorator(msg="Creating Tables from CSV")
     @check_errors(on_off=True)
-    def create_tables_from_csv(self, csv: CSVInfo) -> list or None:
+    def create_tables_from_csv(self, csv: CSVInfo, table_name: str = None) -> list or None:
         """
         Takes a .csv file and creates a table in the
         database for each file.
@@ -54,13 +275,19 @@ class DatabaseModifier:
         Args:
         csv: CSVInfo
         """
-        table_name = csv.filename
-        query = f"CREATE TABLE IF NOT EXISTS {table_name} ("
+        if not table_name:
+            table_name = csv.filename
+        query = f"{self._create_table_prefix(table_name)} IF NOT EXISTS {table_name} ("
         for column in csv.list_of_columns:
-            postgres_data_type = self._get_data_types(column=str(column))
+            if self.compact_types:
+                postgres_data_type = self._get_compact_data_type(csv=csv, column=str(column))
+            else:
+                postgres_data_type = self._get_data_types(column=str(column))
             query += f"{column} {postgres_data_type}, "
         query = query.rstrip(', ')
         query += ")"
+        if self.bulk_load:
+            query += " WITH (autovacuum_enabled = false)"
         return self.db.execute(query)
 
     @timing_decorator(msg="Loading CSV into Table")
@@ -68,22 +295,66 @@ class DatabaseModifier:
     def load_csv_into_table(self, csv: CSVInfo, table_name: str = None):
         """
         Takes a .csv file and loads it into a table in the
-        database.
+        database. The file is streamed to COPY, compressed
+        files are decompressed on the fly while they are sent.
 
         Args:
         csv: CSVInfo
         """
         if not table_name:
             table_name = csv.filename.split(".")[0]
+        if self.bulk_load:
+            self._defer_indexes(table_name)
+
+        start_time = time.time()
+        query = f"COPY {table_name} FROM STDIN DELIMITER ',' CSV HEADER;"
+        try:
+            with open_decompressed(csv.full_path) as file:
+                self.db.cursor.copy_expert(sql=query, file=file)
+        except Exception:
+            if not self.db.in_transaction:
+                self.db.connection.rollback()
+            raise
+        self.db.commit()
+
+        self.load_stats["files"] += 1
+        self.load_stats["rows"] += max(self.db.cursor.rowcount, 0)
+        self.load_stats["bytes"] += os.path.getsize(csv.full_path)
+        self.load_stats["seconds"] += time.time() - start_time
+
+    @timing_decorator(msg="Measuring Storage")
+    @check_errors(on_off=True)
+    def report_storage(self, table_name: str) -> dict:
+        """
+        Compares, column by column, the bytes a table uses with its
+        current data types against the bytes it would use with the
+        default data types, and prints the size reduction.
+
+        Args:
+        table_name: str
+
+        Returns:
+        dict
+        """
+        columns = [column for column in self.db.get_columns(table_name) if column in CSV_TO_POSTGRES_TYPES]
+        sums = []
+        for column in columns:
+            sums.append(f"COALESCE(SUM(pg_column_size({column})), 0)")
+            sums.append(f"COALESCE(SUM(pg_column_size({column}::{self._get_data_types(column)})), 0)")
+        result = self.db.execute(f"SELECT {', '.join(sums)} FROM {table_name}")[0]
 
-        with open(csv.full_path, 'r') as file:
-            # Read the contents of the file
-            file_contents = file.read()
-            file_like_object = io.StringIO(file_contents)
+        report = {}
+        for i, column in enumerate(columns):
+            current, default = int(result[2 * i]), int(result[2 * i + 1])
+            report[column] = (current, default)
+            print(f"{column}: {default / 1e6:.2f} MB -> {current / 1e6:.2f} MB")
 
-            query = f"COPY {table_name} FROM STDIN DELIMITER ',' CSV HEADER;"
-            self.db.cursor.copy_expert(sql=query, file=file_like_object)
-            self.db.connection.commit()
+        current_total = sum(current for current, _ in report.values())
+        default_total = sum(default for _, default in report.values())
+        if default_total:
+            print(f"{table_name}: {default_total / 1e6:.2f} MB -> {current_total / 1e6:.2f} MB "
+                  f"({100 * (1 - current_total / default_total):.1f}% smaller)")
+        return report
 
     @timing_decorator(msg="Merging Tables")
     @check_errors(on_off=True)
@@ -92,7 +363,8 @@ class DatabaseModifier:
         Takes a list of tables and creates a single
         table named 'name' in the database. Merging the
         files into one table. If no name is given, we
-        will return an error.
+        will return an error. An existing table 'name'
+        is dropped and rebuilt from the tables.
 
         Args:
         tables: list
@@ -101,14 +373,92 @@ class DatabaseModifier:
         if not name or not tables:
             raise ValueError("Please provide a name for the table and a list of tables to merge.")
 
-        if self.db.table_exists(name):
-            self.db.execute(f"TRUNCATE {name}")
-        query = f"CREATE TABLE IF NOT EXISTS {name} AS ("
+        column_types = self._common_column_types(tables)
+        query = f"{self._create_table_prefix(name)} {name} AS ("
         for table in tables:
-            query += f"SELECT * FROM {table} UNION ALL "
+            query += f"SELECT {self._cast_columns(table, column_types)} FROM {table} UNION ALL "
         query = query.rstrip("UNION ALL ")  # Remove trailing "UNION ALL"
         query += ")"
-        return self.db.execute(query)
+        with self.db.transaction():
+            self.db.drop_table(name)
+            return self.db.execute(query)
+
+    @timing_decorator(msg="Appending Tables")
+    @check_errors(on_off=True)
+    def append_tables_to_one(self, tables: list, name: str) -> list or None:
+        """
+        Appends the rows of a list of tables to the existing table
+        'name', for the tables added since it was merged. Columns
+        of 'name' whose type does not fit the new tables are first
+        converted to a common type. The table is merged from
+        scratch if it does not exist yet.
+
+        Args:
+        tables: list
+        name: str
+        """
+        if not name or not tables:
+            raise ValueError("Please provide a name for the table and a list of tables to append.")
+        if not self.db.table_exists(name):
+            return self.merge_existing_tables_to_one(tables=tables, name=name)
+
+        source_columns = self._common_column_types(tables)
+        column_types = {
+            column: data_type for column, data_type in self._common_column_types(tables + [name]).items()
+            if column in source_columns
+        }
+        target_types = self.db.get_column_types(name)
+        selects = [f"SELECT {self._cast_columns(table, column_types)} FROM {table}" for table in tables]
+        query = f"INSERT INTO {name} ({', '.join(column_types)}) {' UNION ALL '.join(selects)}"
+        with self.db.transaction():
+            for column, data_type in column_types.items():
+                if target_types.get(column) != data_type:
+                    self.db.execute(
+                        f"ALTER TABLE {name} ALTER COLUMN {column} TYPE {data_type} USING {column}::{data_type}")
+            self.db.execute(query)
+            appended_rows = self.db.cursor.rowcount
+        print(f"Appended {appended_rows} rows to {name}")
+
+    def _common_column_types(self, tables: list) -> dict:
+        """
+        Returns a single data type per column for a set of tables:
+        the type of the column when every table agrees on it, its
+        default data type otherwise. With compact types each file
+        gets its own types, so one month's user_session can be UUID
+        and another's VARCHAR, which UNION ALL cannot match.
+
+        Args:
+        tables: list
+
+        Returns:
+        dict
+        """
+        types = {}
+        for table in tables:
+            for column, data_type in self.db.get_column_types(table).items():
+                types.setdefault(column, set()).add(data_type)
+        return {
+            column: data_types.pop() if len(data_types) == 1 else CSV_TO_POSTGRES_TYPES.get(column, "TEXT")
+            for column, data_types in types.items()
+        }
+
+    def _cast_columns(self, table: str, column_types: dict) -> str:
+        """
+        Returns the select list of a table with every column whose
+        type differs from 'column_types' cast to that type.
+
+        Args:
+        table: str
+        column_types: dict
+
+        Returns:
+        str
+        """
+        table_types = self.db.get_column_types(table)
+        return ', '.join(
+            column if table_types.get(column) == data_type else f"{column}::{data_type} AS {column}"
+            for column, data_type in column_types.items()
+        )
 
     @timing_decorator(msg="Removing Duplicates")
     @check_errors(on_off=True)
@@ -135,17 +485,55 @@ class DatabaseModifier:
         """
 
         print("Deleting rows...")
-        result = self.db.execute(delete_query)
+        result = self.db.execute(delete_query) or []
         print(f"Rows deleted: {len(result)}")
         result_string = '\n'.join([str(row) for row in result])
         write_to_file('deleted_rows.txt', result_string)
         return result
 
+    @timing_decorator(msg="Compacting Table")
+    @check_errors(on_off=True)
+    def compact_table(self, table_name: str, key_column: str) -> list or None:
+        """
+        Collapses a table to one row per 'key_column', keeping
+        for every other column a non-null value when one of the
+        duplicates has it, then makes 'key_column' the primary
+        key so lookups on it become single index probes.
+
+        Args:
+        table_name: str
+        key_column: str
+        """
+        columns = self.db.get_columns(table_name)
+        if key_column not in columns:
+            raise ValueError(f"Column {key_column} does not exist in {table_name}.")
+
+        total_rows = self.db.get_total_rows(table_name)
+        aggregates = [f"MAX({column}) AS {column}" for column in columns if column != key_column]
+        compact_table = f"{table_name}_compact"
+
+        with self.db.transaction():
+            self.db.drop_table(compact_table)
+            self.db.execute(f"""
+                CREATE TABLE {compact_table} AS
+                SELECT {key_column}, {', '.join(aggregates)}
+                FROM {table_name}
+                WHERE {key_column} IS NOT NULL
+                GROUP BY {key_column}
+            """)
+            self.db.drop_table(table_name)
+            self.db.execute(f"ALTER TABLE {compact_table} RENAME TO {table_name}")
+            self.db.execute(f"ALTER TABLE {table_name} ADD PRIMARY KEY ({key_column})")
+
+        compact_rows = self.db.get_total_rows(table_name)
+        print(f"Compacted {table_name}: {total_rows} rows -> {compact_rows} rows")
+
     @timing_decorator(msg="Joining tables")
     @check_errors(on_off=True)
     def join_tables(self, table1: str, table2: str, common_column: str) -> list or None:
         list_of_columns_t1 = self.db.get_columns(table1)
         list_of_columns_t2 = self.db.get_columns(table2)
+        column_types_t2 = self.db.get_column_types(table2)
 
         list_of_columns_to_insert = [column for column in list_of_columns_t2 if column not in list_of_columns_t1]
         print(f"You're about to add the following columns to {table1}: {list_of_columns_to_insert}!")
@@ -153,11 +541,6 @@ class DatabaseModifier:
         if warning.lower() != 'y':
             return
 
-        for column in list_of_columns_to_insert:
-            postgres_data_type = self._get_data_types(str(column))
-            query = f"ALTER TABLE {table1} ADD COLUMN {column} {postgres_data_type};"
-            self.db.execute(query)
-
         list_of_columns_t2.remove(common_column)
         columns_to_add = [f"{column} = i.{column}" for column in list_of_columns_t2]
 
@@ -167,7 +550,12 @@ class DatabaseModifier:
             FROM {table2} i
             WHERE c.{common_column} = i.{common_column};
         """
-        return self.db.execute(join_query)
+        with self.db.transaction():
+            for column in list_of_columns_to_insert:
+                postgres_data_type = column_types_t2[column]
+                query = f"ALTER TABLE {table1} ADD COLUMN {column} {postgres_data_type};"
+                self.db.execute(query)
+            return self.db.execute(join_query)
 
         # query = (
         #     f"UPDATE {table1} c "
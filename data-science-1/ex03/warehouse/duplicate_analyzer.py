@@ -0,0 +1,227 @@
+import os
+import tempfile
+
+from warehouse.load_from_dir import LoadFromDir
+from warehouse.utils import check_errors, timing_decorator
+
+DEFAULT_KEYS = ("product_id", "price", "user_id", "user_session")
+
+
+class DuplicateAnalyzer:
+    """
+    A class that previews, on the source CSV/Parquet files, which
+    rows DatabaseModifier.remove_duplicates would delete, without
+    touching the database. A row is a near-duplicate when another
+    row has the same 'keys' and an event_time at most 'tolerance'
+    seconds away; rows with a null key never match, as in SQL.
+
+    Rows are sorted by keys and time, so every near-duplicate is
+    next to the row it duplicates, and a single vectorized sweep
+    compares each row with the previous one. The file is read in
+    chunks of 'chunk_size' rows, split into 'partitions' buckets by
+    hash of user_session and spilled to temporary files, then the
+    buckets are loaded and swept one at a time, so memory holds a
+    chunk while reading and a bucket while sorting.
+
+    Every file is analyzed on its own, so near-duplicates split
+    across two files are not counted.
+
+    Attributes:
+    keys: tuple
+    tolerance: float
+    partitions: int
+    chunk_size: int
+    samples: int
+
+    Methods:
+    analyze_file: dict
+    analyze_directory: dict
+    print_report: None
+    """
+    def __init__(self, keys: tuple = DEFAULT_KEYS, tolerance: float = 1.0, partitions: int = 16,
+                 chunk_size: int = 1000000, samples: int = 5):
+        self.keys = list(keys)
+        self.tolerance = tolerance
+        self.partitions = partitions
+        self.chunk_size = chunk_size
+        self.samples = samples
+        self.report = {}
+
+    def _read(self, path: str):
+        """
+        Yields the key and event_time columns of a file, in chunks.
+
+        Args:
+        path: str
+
+        Returns:
+        generator of pd.DataFrame
+        """
+        import pandas as pd
+
+        columns = self.keys + ["event_time"]
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=self.chunk_size, columns=columns):
+                yield batch.to_pandas()
+            return
+        yield from pd.read_csv(path, usecols=columns, chunksize=self.chunk_size)
+
+    def _partition(self, path: str, spill_dir: str) -> list:
+        """
+        Reads a file chunk by chunk and writes its rows with non-null
+        keys to 'spill_dir', split into buckets by hash of
+        user_session (or of the first key). Returns the files of
+        every non-empty bucket.
+
+        Args:
+        path: str
+        spill_dir: str
+
+        Returns:
+        list of lists of str
+        """
+        import pandas as pd
+
+        bucket_column = "user_session" if "user_session" in self.keys else self.keys[0]
+        buckets = [[] for _ in range(self.partitions)]
+        rows = 0
+        for chunk_number, chunk in enumerate(self._read(path)):
+            rows += len(chunk)
+            chunk = chunk.dropna(subset=self.keys + ["event_time"])
+            chunk["event_time"] = pd.to_datetime(chunk["event_time"], utc=True)
+            bucket = pd.util.hash_pandas_object(chunk[bucket_column], index=False).to_numpy() % self.partitions
+            for i in range(self.partitions):
+                part = chunk[bucket == i]
+                if len(part):
+                    part_path = os.path.join(spill_dir, f"bucket_{i}_{chunk_number}.pkl")
+                    part.to_pickle(part_path)
+                    buckets[i].append(part_path)
+        self._rows = rows
+        return [parts for parts in buckets if parts]
+
+    def _sweep(self, frame):
+        """
+        Sorts a bucket by keys and time and flags its near-duplicates.
+        'flagged' marks every row that has a near-duplicate, which is
+        what remove_duplicates deletes; 'redundant' marks every row
+        but the first of each chain of near-duplicates, which is what
+        keeping one copy would delete.
+
+        Args:
+        frame: pd.DataFrame
+
+        Returns:
+        pd.DataFrame
+        """
+        import numpy as np
+
+        frame = frame.sort_values(self.keys + ["event_time"], kind="mergesort", ignore_index=True)
+        seconds = (frame["event_time"].dt.tz_convert(None).to_numpy(dtype="datetime64[ns]")
+                   .astype(np.int64) / 1e9)
+
+        same_keys = np.ones(len(frame), dtype=bool)
+        same_keys[0] = False
+        for key in self.keys:
+            values = frame[key].to_numpy()
+            same_keys[1:] &= values[1:] == values[:-1]
+
+        close = np.zeros(len(frame), dtype=bool)
+        close[1:] = np.diff(seconds) <= self.tolerance
+        redundant = same_keys & close
+
+        flagged = redundant.copy()
+        flagged[:-1] |= redundant[1:]
+        frame["flagged"] = flagged
+        frame["redundant"] = redundant
+        return frame
+
+    def _count(self, frame, months: dict) -> None:
+        """
+        Adds the rows, flagged rows, redundant rows and samples of a
+        swept bucket to the per-month statistics.
+
+        Args:
+        frame: pd.DataFrame
+        months: dict
+        """
+        frame["month"] = frame["event_time"].dt.strftime("%Y-%m")
+        counts = frame.groupby("month")[["flagged", "redundant"]].agg(["size", "sum"])
+        for month, row in counts.iterrows():
+            stats = months.setdefault(month, {"rows": 0, "flagged": 0, "redundant": 0, "samples": []})
+            stats["rows"] += int(row[("flagged", "size")])
+            stats["flagged"] += int(row[("flagged", "sum")])
+            stats["redundant"] += int(row[("redundant", "sum")])
+
+        for month, sample in frame[frame["flagged"]].groupby("month"):
+            stats = months[month]
+            missing = self.samples - len(stats["samples"])
+            if missing > 0:
+                sample = sample.head(missing)[self.keys + ["event_time"]]
+                sample = sample.assign(event_time=sample["event_time"].astype(str))
+                stats["samples"].extend(sample.to_dict("records"))
+
+    @timing_decorator(msg="Analyzing Duplicates")
+    @check_errors(on_off=True)
+    def analyze_file(self, path: str) -> dict:
+        """
+        Returns, per month of event_time, the number of rows, of
+        flagged rows and of redundant rows of a file, with a few
+        sample flagged rows.
+
+        Args:
+        path: str
+
+        Returns:
+        dict
+        """
+        import pandas as pd
+
+        months = {}
+        self._rows = 0
+        with tempfile.TemporaryDirectory(prefix="duplicates_") as spill_dir:
+            for parts in self._partition(path, spill_dir):
+                frame = pd.concat([pd.read_pickle(part) for part in parts], ignore_index=True)
+                self._count(self._sweep(frame), months)
+
+        result = {"file": os.path.basename(path), "rows": self._rows, "months": dict(sorted(months.items()))}
+        self.report[path] = result
+        return result
+
+    @check_errors(on_off=True)
+    def analyze_directory(self, directory: str, prefix: str = "data_202") -> dict:
+        """
+        Analyzes every .csv (plain or compressed) and .parquet file
+        of a directory whose name starts with 'prefix'.
+
+        Args:
+        directory: str
+        prefix: str
+
+        Returns:
+        dict
+        """
+        files = []
+        for file_extension in ("csv", "parquet"):
+            try:
+                files += LoadFromDir(directory=directory, file_extension=file_extension).files
+            except FileNotFoundError:
+                pass
+        files = [path for path in sorted(files) if os.path.basename(path).startswith(prefix)]
+        if not files:
+            raise FileNotFoundError(f"No {prefix}* files found in {directory}.")
+        for path in files:
+            self.analyze_file(path)
+        return self.report
+
+    def print_report(self) -> None:
+        print(f"Keys: {self.keys}, tolerance: {self.tolerance} seconds")
+        for result in self.report.values():
+            print(f"\nFile: {result['file']} ({result['rows']} rows)")
+            for month, stats in result["months"].items():
+                print(f"{month}: {stats['flagged']} rows with a near-duplicate "
+                      f"({100 * stats['flagged'] / stats['rows']:.2f}%), "
+                      f"{stats['redundant']} redundant copies")
+                for sample in stats["samples"]:
+                    print(f"    {sample}")
@@ -0,0 +1,315 @@
+import os
+import re
+import csv
+import sqlite3
+
+from datetime import date, datetime
+from contextlib import contextmanager
+
+from warehouse.load_from_dir import LoadFromDir
+from warehouse.utils import CSV_TO_POSTGRES_TYPES, check_errors, timing_decorator, open_binary
+
+SQLITE_TYPES = {
+    "TIMESTAMP": "TIMESTAMP",
+    "INTEGER": "INTEGER",
+    "BIGINT": "INTEGER",
+    "FLOAT": "REAL",
+    "VARCHAR(255)": "TEXT",
+}
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+DATETIME_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+
+class EmbeddedConnection:
+    """
+    A class with the interface of DatabaseConnection backed by an
+    embedded SQLite database, to run the chart and stats queries
+    on local CSV or Parquet files without a PostgreSQL server.
+
+    Queries are written for psycopg2: '%s' placeholders are
+    translated to '?', and dates and timestamps returned as text
+    by SQLite are converted to date and datetime objects, like
+    psycopg2 does.
+
+    The merged customer table is deduplicated with the rule of
+    DatabaseModifier.remove_duplicates, but the item table is not
+    fused into it: the brand and category columns are missing.
+
+    Attributes:
+    path: str
+    connection: sqlite3.Connection
+    cursor: sqlite3.Cursor
+
+    Methods:
+    close: None
+    execute: list or None
+    load_file: int
+    load_directory: None
+    sync_directory: bool
+    remove_duplicates: int
+    """
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.cursor = self.connection.cursor()
+        self.in_transaction = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def clone(self):
+        """
+        Opens a new connection to the same database file.
+
+        Returns:
+        EmbeddedConnection
+        """
+        if self.path == ":memory:":
+            raise ValueError("An in-memory database cannot be shared between connections, use a file.")
+        return EmbeddedConnection(self.path)
+
+    def close(self):
+        """
+        Closes the cursor and connection to the database.
+        """
+        self.cursor.close()
+        self.connection.close()
+
+    @staticmethod
+    def _translate(query: str) -> str:
+        return query.replace("%s", "?").replace("%%", "%")
+
+    @staticmethod
+    def _convert(value):
+        if isinstance(value, str):
+            if len(value) == 10 and DATE_PATTERN.fullmatch(value):
+                return date.fromisoformat(value)
+            if len(value) == 19 and DATETIME_PATTERN.fullmatch(value):
+                return datetime.fromisoformat(value)
+        return value
+
+    def execute(self, query, params=None) -> list or None:
+        """
+        Executes a SQL query.
+
+        Args:
+        query: str
+
+        Returns:
+        list or None
+        """
+        try:
+            self.cursor.execute(self._translate(query), params or ())
+            rows = self.cursor.fetchall()
+        finally:
+            self.commit()
+        return [tuple(self._convert(value) for value in row) for row in rows] or None
+
+    def commit(self):
+        if not self.in_transaction:
+            self.connection.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs every statement of the block in a single transaction.
+        """
+        if self.in_transaction:
+            yield self
+            return
+
+        self.in_transaction = True
+        try:
+            yield self
+        except Exception:
+            self.connection.rollback()
+            raise
+        else:
+            self.connection.commit()
+        finally:
+            self.in_transaction = False
+
+    def get_columns(self, table_name: str) -> list:
+        self.cursor.execute(f"SELECT * FROM {table_name} LIMIT 0")
+        return [desc[0] for desc in self.cursor.description]
+
+    def get_total_rows(self, table_name: str) -> int:
+        return self.execute(f"SELECT COUNT(*) FROM {table_name}")[0][0]
+
+    def drop_table(self, table_name: str):
+        return self.execute(f"DROP TABLE IF EXISTS {table_name}")
+
+    def table_exists(self, table_name: str) -> bool:
+        return bool(self.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", (table_name,)))
+
+    def _create_table(self, table_name: str, columns: list) -> None:
+        definitions = [
+            f"{column} {SQLITE_TYPES.get(CSV_TO_POSTGRES_TYPES.get(column), 'TEXT')}" for column in columns
+        ]
+        self.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(definitions)})")
+
+    def _insert_rows(self, table_name: str, columns: list, rows) -> int:
+        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        self.cursor.executemany(query, rows)
+        return self.cursor.rowcount
+
+    @timing_decorator(msg="Loading File into Embedded Database")
+    @check_errors(on_off=True)
+    def load_file(self, path: str, table_name: str) -> int:
+        """
+        Appends a .csv (plain or compressed) or .parquet file to a
+        table, creating it if needed. Empty fields become NULL and
+        the ' UTC' suffix of event_time is dropped so timestamps
+        compare and convert like in PostgreSQL.
+
+        Args:
+        path: str
+        table_name: str
+
+        Returns:
+        int
+        """
+        if path.endswith(".parquet"):
+            import pandas as pd
+
+            data = pd.read_parquet(path)
+            columns = list(data.columns)
+            if "event_time" in columns:
+                data["event_time"] = pd.to_datetime(data["event_time"]).dt.strftime("%Y-%m-%d %H:%M:%S")
+            rows = data.astype(object).where(data.notna(), None).itertuples(index=False, name=None)
+            with self.transaction():
+                self._create_table(table_name, columns)
+                return self._insert_rows(table_name, columns, rows)
+
+        with open_binary(path) as file:
+            reader = csv.reader(line.decode() for line in file)
+            columns = next(reader)
+            time_index = columns.index("event_time") if "event_time" in columns else None
+
+            def clean(row):
+                row = [value if value != "" else None for value in row]
+                if time_index is not None and row[time_index]:
+                    row[time_index] = row[time_index].removesuffix(" UTC")
+                return row
+
+            with self.transaction():
+                self._create_table(table_name, columns)
+                return self._insert_rows(table_name, columns, (clean(row) for row in reader))
+
+    @check_errors(on_off=True)
+    def load_directory(self, directory: str, merged_table: str = "customer") -> None:
+        """
+        Loads every .csv/.parquet file of a directory. The
+        data_202* files are appended to 'merged_table' and the
+        other files each get a table named after the file, like
+        the warehouse does in PostgreSQL.
+
+        Args:
+        directory: str
+        merged_table: str
+        """
+        files = sorted(self._scan(directory))
+        if not files:
+            raise FileNotFoundError(f'No .csv or .parquet files found in {directory}.')
+        for path in files:
+            name = os.path.basename(path).split(".")[0]
+            self.load_file(path, merged_table if name.startswith("data_202") else name)
+        if self.table_exists(merged_table):
+            self.remove_duplicates(merged_table)
+        for column in ("event_time", "event_type"):
+            if self.table_exists(merged_table) and column in self.get_columns(merged_table):
+                self.execute(f"CREATE INDEX IF NOT EXISTS {merged_table}_{column} ON {merged_table} ({column})")
+
+    @staticmethod
+    def _scan(directory: str) -> dict:
+        """
+        Returns the size and mtime of every .csv/.parquet file of a
+        directory.
+
+        Args:
+        directory: str
+
+        Returns:
+        dict
+        """
+        entries = {}
+        for file_extension in ("csv", "parquet"):
+            try:
+                entries.update(LoadFromDir(directory=directory, file_extension=file_extension).entries)
+            except FileNotFoundError:
+                pass
+        return entries
+
+    @check_errors(on_off=True)
+    def sync_directory(self, directory: str, merged_table: str = "customer") -> bool:
+        """
+        Loads a directory into the database once. The size and
+        mtime of the loaded files are kept in a _sources table, and
+        the tables are only rebuilt when a file was added, modified
+        or removed since. Returns True if they were rebuilt.
+
+        Args:
+        directory: str
+        merged_table: str
+
+        Returns:
+        bool
+        """
+        current = {path: (entry["size"], entry["mtime"]) for path, entry in self._scan(directory).items()}
+        loaded = {}
+        if self.table_exists("_sources"):
+            rows = self.execute("SELECT path, size, mtime FROM _sources") or []
+            loaded = {path: (size, mtime) for path, size, mtime in rows}
+        if loaded == current and self.table_exists(merged_table):
+            return False
+
+        tables = self.execute("SELECT name FROM sqlite_master WHERE type = 'table'") or []
+        for (table_name,) in tables:
+            self.drop_table(table_name)
+        self.load_directory(directory, merged_table)
+        with self.transaction():
+            self.execute("CREATE TABLE _sources (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER)")
+            self.cursor.executemany("INSERT INTO _sources VALUES (?, ?, ?)",
+                                    [(path, size, mtime) for path, (size, mtime) in current.items()])
+        return True
+
+    @timing_decorator(msg="Removing Duplicates")
+    @check_errors(on_off=True)
+    def remove_duplicates(self, table_name: str) -> int:
+        """
+        Deletes the rows that have another row with the same
+        product_id, price, user_id and user_session less than a
+        second away, like DatabaseModifier.remove_duplicates. The
+        closest such row is a neighbor in time within the group,
+        so window functions find them without a self-join.
+
+        Args:
+        table_name: str
+
+        Returns:
+        int
+        """
+        keys = ["product_id", "price", "user_id", "user_session"]
+        seconds = "ROUND(julianday(event_time) * 86400)"
+        self.execute(f"""
+            DELETE FROM {table_name} WHERE rowid IN (
+                SELECT id FROM (
+                    SELECT rowid AS id,
+                           {seconds} - LAG({seconds}) OVER window_keys AS previous_gap,
+                           LEAD({seconds}) OVER window_keys - {seconds} AS next_gap
+                    FROM {table_name}
+                    WHERE {' AND '.join(f'{key} IS NOT NULL' for key in keys)}
+                    WINDOW window_keys AS (PARTITION BY {', '.join(keys)} ORDER BY event_time)
+                )
+                WHERE previous_gap <= 1 OR next_gap <= 1
+            )
+        """)
+        deleted_rows = self.cursor.rowcount
+        print(f"Rows deleted from {table_name}: {deleted_rows}")
+        return deleted_rows
@@ -1,5 +1,9 @@
 import os
-import glob
+import json
+import time
+import hashlib
+
+from warehouse.utils import COMPRESSIONS
 
 
 class LoadFromDir:
@@ -9,22 +13,37 @@ class LoadFromDir:
     if the directory exists and if the files are
     CSV files and other checks.
 
+    Files compressed with gzip or zstd (.csv.gz, .csv.zst)
+    are found as well, they are decompressed when read.
+
+    When an index file is given, the size, mtime and
+    content hash of every file are persisted there so
+    the next run can tell which files were added,
+    modified or removed since the last saved index.
+
     Args:
     directory: str
+    index_file: str
 
     Returns:
     list
     """
-    def __init__(self, directory=None, file_extension='csv', multiple_subdirectories=True):
+    def __init__(self, directory=None, file_extension='csv', multiple_subdirectories=True, index_file=None):
         """
         Initializes the LoadFromDir class.
         """
         try:
             self.directory = directory
             self.file_extension = file_extension
+            self.suffixes = tuple(
+                ['.' + file_extension] + [f'.{file_extension}{compression}' for compression in COMPRESSIONS])
             self.multiple_subdirectories = multiple_subdirectories
+            self.index_file = index_file
+            self.index = self.read_index()
+            self.entries = {}
             self.filenames = []
             self.files = self.load_from_dir()
+            self.changes = self.detect_changes()
         except Exception as e:
             raise e
 
@@ -46,12 +65,151 @@ class LoadFromDir:
         """
         if not os.path.exists(self.directory):
             raise FileNotFoundError(f'The directory {self.directory} does not exist.')
-        if self.multiple_subdirectories:
-            files = glob.glob(self.directory + '/**/*.' + self.file_extension, recursive=True)
-        else:
-            files = glob.glob(self.directory + '/*.' + self.file_extension)
+        self.entries = self.scan(self.directory)
+        files = sorted(self.entries)
         if not files:
             raise FileNotFoundError(f'No files with the extension {self.file_extension} found in {self.directory}.')
         self.filenames = [os.path.basename(file).split('.')[0] for file in files]
         self.files = files
         return files
+
+    def scan(self, directory: str) -> dict:
+        """
+        Walks the directory with os.scandir and returns the size
+        and mtime of every matching file, reusing the stat result
+        of the directory entry instead of a second stat call.
+
+        Args:
+        directory: str
+
+        Returns:
+        dict
+        """
+        entries = {}
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if self.multiple_subdirectories:
+                        entries.update(self.scan(entry.path))
+                elif entry.is_file() and entry.name.endswith(self.suffixes):
+                    stat = entry.stat()
+                    entries[entry.path] = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        return entries
+
+    @staticmethod
+    def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+        """
+        Returns the BLAKE2 hash of the contents of a file.
+
+        Args:
+        path: str
+        chunk_size: int
+
+        Returns:
+        str
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def detect_changes(self) -> dict:
+        """
+        Compares the scanned files with the saved index. Files are
+        only hashed when their size or mtime differ from the index,
+        so an unchanged directory is checked without reading it.
+        New files are only hashed when there is an index to save.
+
+        Returns:
+        dict
+        """
+        changes = {"added": [], "modified": [], "removed": []}
+        for path, entry in self.entries.items():
+            previous = self.index.get(path)
+            if previous and previous["size"] == entry["size"] and previous["mtime"] == entry["mtime"]:
+                entry["hash"] = previous.get("hash")
+                continue
+            if not previous:
+                entry["hash"] = self.file_hash(path) if self.index_file else None
+                changes["added"].append(path)
+                continue
+            entry["hash"] = self.file_hash(path)
+            if previous.get("hash") != entry["hash"]:
+                changes["modified"].append(path)
+        changes["removed"] = sorted(path for path in self.index if path not in self.entries)
+        changes["added"].sort()
+        changes["modified"].sort()
+        return changes
+
+    @property
+    def changed_files(self) -> list:
+        """
+        Returns the files added or modified since the saved index.
+
+        Returns:
+        list
+        """
+        return sorted(self.changes["added"] + self.changes["modified"])
+
+    def read_index(self) -> dict:
+        """
+        Reads the saved index, or returns an empty one.
+
+        Returns:
+        dict
+        """
+        if not self.index_file or not os.path.exists(self.index_file):
+            return {}
+        with open(self.index_file, 'r') as file:
+            return json.load(file)
+
+    def save_index(self) -> None:
+        """
+        Saves the current scan as the index of the next run.
+        """
+        if not self.index_file:
+            raise ValueError('No index file was given.')
+        temporary_file = self.index_file + '.tmp'
+        with open(temporary_file, 'w') as file:
+            json.dump(self.entries, file, indent=2)
+        os.replace(temporary_file, self.index_file)
+        self.index = {path: dict(entry) for path, entry in self.entries.items()}
+
+    def rescan(self) -> dict:
+        """
+        Scans the directory again and returns the changes since
+        the saved index.
+
+        Returns:
+        dict
+        """
+        self.entries = self.scan(self.directory)
+        self.files = sorted(self.entries)
+        self.filenames = [os.path.basename(file).split('.')[0] for file in self.files]
+        self.changes = self.detect_changes()
+        return self.changes
+
+    def watch(self, interval: float = 5.0):
+        """
+        Polls the directory every 'interval' seconds and yields the
+        changes each time new, modified or removed files show up.
+        The index is saved after every yielded change.
+
+        Args:
+        interval: float
+
+        Returns:
+        generator of dict
+        """
+        while True:
+            changes = self.rescan()
+            if any(changes.values()):
+                yield changes
+                if self.index_file:
+                    self.save_index()
+                else:
+                    self.index = {path: dict(entry) for path, entry in self.entries.items()}
+            time.sleep(interval)
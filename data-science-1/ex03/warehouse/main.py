@@ -4,43 +4,182 @@ import tqdm
 import dotenv
 
 from warehouse.csv_info import CSVInfo
+from warehouse.csv_validator import CSVValidator
+from warehouse.customer_features import CustomerFeatures
+from warehouse.duplicate_analyzer import DuplicateAnalyzer
 from warehouse.utils import check_errors
 from warehouse.load_from_dir import LoadFromDir
+from warehouse.session_funnel import SessionFunnel
 from warehouse.database_modifier import DatabaseModifier
 from warehouse.database_connection import DatabaseConnection
 
 
-@check_errors(on_off=True)
-def main():
+def connect() -> DatabaseConnection:
+    """
+    Connects to the database described by the environment.
+
+    Returns:
+    DatabaseConnection
+    """
     dotenv.load_dotenv()
-    host = os.getenv("DB_HOST")
-    port = os.getenv("DB_PORT")
-    name = os.getenv("DB_NAME")
-    user = os.getenv("DB_USER")
-    password = os.getenv("DB_PASSWORD")
-    with DatabaseConnection(host, port, name, user, password) as db:
-        print(f'Connected to {os.getenv("DB_NAME")} database, user {os.getenv("DB_USER")}.')
-        customer_directory = os.getenv("CSV_DIRECTORY")
-        print(f'Loading files from {customer_directory}...')
-        with LoadFromDir(directory=customer_directory) as loader:
-            modifier = DatabaseModifier(db)
-            progress = tqdm.tqdm(loader.files, desc='Creating tables from CSV', file=sys.stdout)
-            for file in range(len(loader.files)):
-                csv = CSVInfo(loader.files[file])
+    db = DatabaseConnection(
+        os.getenv("DB_HOST"),
+        os.getenv("DB_PORT"),
+        os.getenv("DB_NAME"),
+        os.getenv("DB_USER"),
+        os.getenv("DB_PASSWORD"),
+    )
+    print(f'Connected to {os.getenv("DB_NAME")} database, user {os.getenv("DB_USER")}.')
+    return db
+
+
+def get_modifier(db: DatabaseConnection) -> DatabaseModifier:
+    compact_types = os.getenv("COMPACT_TYPES", "false").lower() == "true"
+    return DatabaseModifier(db, compact_types=compact_types)
+
+
+@check_errors(on_off=True)
+def ingest(db: DatabaseConnection) -> None:
+    """
+    Loads the .csv files of CSV_DIRECTORY into tables and merges
+    the data_202* tables into the customer table.
+
+    Args:
+    db: DatabaseConnection
+    """
+    customer_directory = os.getenv("CSV_DIRECTORY")
+    print(f'Loading files from {customer_directory}...')
+    index_file = os.getenv("INDEX_FILE")
+    with LoadFromDir(directory=customer_directory, index_file=index_file) as loader:
+        modifier = get_modifier(db)
+        bulk_load = os.getenv("BULK_LOAD", "false").lower() == "true"
+        if os.getenv("BENCH_BULK_LOAD", "false").lower() == "true":
+            modifier.compare_load_modes(csv=CSVInfo(loader.files[0]))
+        if bulk_load:
+            modifier.start_bulk_load()
+        try:
+            validate_csv = os.getenv("VALIDATE_CSV", "false").lower() == "true"
+            files_to_load = loader.changed_files if index_file else loader.files
+            print(f'Files added: {len(loader.changes["added"])}, modified: {len(loader.changes["modified"])}, '
+                  f'removed: {len(loader.changes["removed"])}')
+            for file in loader.changes["removed"]:
+                db.drop_table(os.path.basename(file).split('.')[0])
+            progress = tqdm.tqdm(files_to_load, desc='Creating tables from CSV', file=sys.stdout)
+            for file in range(len(files_to_load)):
+                if validate_csv:
+                    validator = CSVValidator(files_to_load[file])
+                    if not validator.is_valid():
+                        validator.print_report()
+                        raise ValueError(f'{files_to_load[file]} is truncated or malformed, not loading it.')
+                csv = CSVInfo(files_to_load[file])
+                if files_to_load[file] in loader.changes["modified"]:
+                    db.drop_table(csv.filename)
                 modifier.create_tables_from_csv(csv=csv)
                 modifier.load_csv_into_table(csv=csv)
+                if validate_csv:
+                    validator.compare_with_table(db, csv.filename)
                 progress.update(1)
 
             tables_to_merge = [
                 table for table in loader.filenames
                 if table.startswith('data_202')]
+            changed_tables = [
+                os.path.basename(file).split('.')[0]
+                for file in loader.changes["modified"] + loader.changes["removed"]
+                if os.path.basename(file).startswith('data_202')]
+            added_tables = [
+                os.path.basename(file).split('.')[0]
+                for file in loader.changes["added"]
+                if os.path.basename(file).startswith('data_202')]
+
+            if index_file and not changed_tables and db.table_exists('customer'):
+                if added_tables:
+                    print(f'\nAppending tables: {added_tables}')
+                    CustomerFeatures(db).check_appended(added_tables)
+                    modifier.append_tables_to_one(tables=added_tables, name='customer')
+                else:
+                    print('\nTable customer is up to date')
+            else:
+                print(f'\nMerging tables: {tables_to_merge}')
+                modifier.merge_existing_tables_to_one(tables=tables_to_merge, name='customer')
+                CustomerFeatures(db).mark_stale(f'customer merged again from {tables_to_merge}')
+            if index_file:
+                loader.save_index()
+            modifier.report_throughput()
+        finally:
+            if bulk_load:
+                modifier.finish_bulk_load()
+        if modifier.compact_types:
+            modifier.report_storage(table_name='customer')
+
+
+@check_errors(on_off=True)
+def dedup(db: DatabaseConnection) -> None:
+    """
+    Removes the duplicate rows of the customer table.
+
+    Args:
+    db: DatabaseConnection
+    """
+    if os.getenv("DEDUP_PREVIEW", "false").lower() == "true":
+        analyzer = DuplicateAnalyzer()
+        analyzer.analyze_directory(os.getenv("CSV_DIRECTORY"))
+        analyzer.print_report()
+    print('Removing duplicates from customer table...')
+    if get_modifier(db).remove_duplicates(table_name='customer'):
+        CustomerFeatures(db).mark_stale('duplicates removed from customer')
+
 
-            print(f'\nMerging tables: {tables_to_merge}')
-            modifier.merge_existing_tables_to_one(tables=tables_to_merge, name='customer')
-            print('Removing duplicates from customer table...')
-            modifier.remove_duplicates(table_name='customer')
-            print('Joining table customer to table item on product_id...')
-            modifier.join_tables(table1='customer', table2='item', common_column='product_id')
+@check_errors(on_off=True)
+def fuse(db: DatabaseConnection) -> None:
+    """
+    Compacts the item table and joins it to the customer table.
+
+    Args:
+    db: DatabaseConnection
+    """
+    modifier = get_modifier(db)
+    print('Compacting item table on product_id...')
+    modifier.compact_table(table_name='item', key_column='product_id')
+    print('Joining table customer to table item on product_id...')
+    modifier.join_tables(table1='customer', table2='item', common_column='product_id')
+
+
+@check_errors(on_off=True)
+def features(db: DatabaseConnection) -> None:
+    """
+    Updates the per-customer feature table with the new events
+    of the customer table.
+
+    Args:
+    db: DatabaseConnection
+    """
+    print('Updating customer features...')
+    CustomerFeatures(db).update()
+
+
+@check_errors(on_off=True)
+def funnel(db: DatabaseConnection) -> None:
+    """
+    Computes the session funnel of the customer table and writes
+    its daily counters to the session_funnel_daily table.
+
+    Args:
+    db: DatabaseConnection
+    """
+    session_funnel = SessionFunnel(db)
+    session_funnel.run()
+    session_funnel.print_report()
+    session_funnel.persist()
+
+
+@check_errors(on_off=True)
+def main():
+    with connect() as db:
+        ingest(db)
+        dedup(db)
+        fuse(db)
+        features(db)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,221 @@
+import math
+
+from datetime import date, timedelta
+
+from warehouse.database_connection import DatabaseConnection
+from warehouse.sharded_query import LogHistogram
+from warehouse.utils import check_errors, timing_decorator
+
+EVENT_CODES = {"view": 0, "cart": 1, "remove_from_cart": 2, "purchase": 3}
+DAILY_COUNTERS = ["sessions", "view_sessions", "cart_sessions", "purchase_sessions", "carted_sessions",
+                  "abandoned_sessions", "session_seconds"]
+
+
+class SessionFunnel:
+    """
+    A class that computes session and funnel analytics of the
+    customer table in a single pass over its events, streamed
+    ordered by user_session and event_time from a server-side
+    cursor and processed chunk by chunk with NumPy. Only the
+    events of the session cut by a chunk boundary are carried
+    to the next chunk, so memory stays bounded by the chunk size.
+
+    The funnel is ordered: a session reaches the cart step if it
+    puts something in the cart after its first view, and the
+    purchase step if it buys after that cart. A session is
+    abandoned when it has a cart event and no purchase.
+
+    Attributes:
+    db: DatabaseConnection
+    table_name: str
+    chunk_size: int
+    daily: dict
+
+    Methods:
+    run: dict
+    print_report: None
+    persist: None
+    """
+    def __init__(self, db: DatabaseConnection, table_name: str = "customer", chunk_size: int = 500000):
+        self.db = db
+        self.table_name = table_name
+        self.chunk_size = chunk_size
+        self.daily = {}
+        self.lengths = LogHistogram()
+        self.summary = None
+
+    def _stream(self, start=None, end=None):
+        """
+        Yields chunks of (sessions, event codes, epoch seconds) arrays,
+        ordered by session and time, from a server-side cursor.
+
+        Args:
+        start: datetime
+        end: datetime
+
+        Returns:
+        generator of tuples of np.ndarray
+        """
+        import numpy as np
+
+        conditions = ["user_session IS NOT NULL", "event_time IS NOT NULL"]
+        params = []
+        if start:
+            conditions.append("event_time >= %s")
+            params.append(start)
+        if end:
+            conditions.append("event_time < %s")
+            params.append(end)
+        cases = ' '.join(f"WHEN '{event}' THEN {code}" for event, code in EVENT_CODES.items())
+        query = f"""
+            SELECT user_session::text, CASE event_type::text {cases} ELSE -1 END,
+                   EXTRACT(EPOCH FROM event_time)::float8
+            FROM {self.table_name}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY user_session, event_time
+        """
+        cursor = self.db.connection.cursor(name="session_funnel")
+        cursor.itersize = self.chunk_size
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                sessions, codes, times = zip(*rows)
+                yield np.array(sessions, dtype=object), np.array(codes, dtype=np.int8), np.array(times)
+        finally:
+            cursor.close()
+            self.db.commit()
+
+    def _process(self, sessions, codes, times) -> None:
+        """
+        Adds the complete sessions of a chunk to the daily counters
+        and to the session length histogram.
+
+        Args:
+        sessions: np.ndarray
+        codes: np.ndarray
+        times: np.ndarray
+        """
+        import numpy as np
+
+        starts = np.flatnonzero(np.r_[True, sessions[1:] != sessions[:-1]])
+        group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(sessions)]))
+
+        start_time = np.minimum.reduceat(times, starts)
+        length = np.maximum.reduceat(times, starts) - start_time
+
+        first_view = np.minimum.reduceat(np.where(codes == EVENT_CODES["view"], times, np.inf), starts)
+        is_cart = codes == EVENT_CODES["cart"]
+        is_purchase = codes == EVENT_CODES["purchase"]
+        first_cart = np.minimum.reduceat(np.where(is_cart & (times >= first_view[group]), times, np.inf), starts)
+        purchased_after_cart = np.logical_or.reduceat(is_purchase & (times >= first_cart[group]), starts)
+        has_cart = np.logical_or.reduceat(is_cart, starts)
+        has_purchase = np.logical_or.reduceat(is_purchase, starts)
+
+        counters = np.stack([
+            np.ones(len(starts)),
+            np.isfinite(first_view),
+            np.isfinite(first_cart),
+            purchased_after_cart,
+            has_cart,
+            has_cart & ~has_purchase,
+            length,
+        ]).astype(np.float64)
+
+        days, day_index = np.unique(np.floor(start_time / 86400).astype(np.int64), return_inverse=True)
+        day_totals = np.stack([np.bincount(day_index, weights=counter, minlength=len(days)) for counter in counters])
+        for i, day in enumerate(days.tolist()):
+            self.daily[day] = self.daily[day] + day_totals[:, i] if day in self.daily else day_totals[:, i]
+
+        positive = length > 0
+        gamma = self.lengths.gamma
+        self.lengths.add(0, 0, int((~positive).sum()))
+        bins, counts = np.unique(np.ceil(np.log(length[positive]) / math.log(gamma)).astype(np.int64),
+                                 return_counts=True)
+        for index, count in zip(bins.tolist(), counts.tolist()):
+            self.lengths.add(1, index, count)
+
+    @timing_decorator(msg="Session Funnel")
+    @check_errors(on_off=True)
+    def run(self, start=None, end=None) -> dict:
+        """
+        Streams the events of [start, end) (all of them by default)
+        and returns the funnel summary.
+
+        Args:
+        start: datetime
+        end: datetime
+
+        Returns:
+        dict
+        """
+        import numpy as np
+
+        self.daily = {}
+        self.lengths = LogHistogram()
+        carry = None
+        for sessions, codes, times in self._stream(start, end):
+            if carry is not None:
+                sessions = np.concatenate([carry[0], sessions])
+                codes = np.concatenate([carry[1], codes])
+                times = np.concatenate([carry[2], times])
+            other_sessions = sessions != sessions[-1]
+            cut = len(sessions) - int(np.argmax(other_sessions[::-1])) if other_sessions.any() else 0
+            carry = (sessions[cut:], codes[cut:], times[cut:])
+            if cut:
+                self._process(sessions[:cut], codes[:cut], times[:cut])
+        if carry is not None and len(carry[0]):
+            self._process(*carry)
+
+        totals = np.sum(list(self.daily.values()), axis=0) if self.daily else np.zeros(len(DAILY_COUNTERS))
+        totals = dict(zip(DAILY_COUNTERS, totals.tolist()))
+        self.summary = {
+            "sessions": int(totals["sessions"]),
+            "avg_session_seconds": totals["session_seconds"] / totals["sessions"] if totals["sessions"] else 0.0,
+            "median_session_seconds": self.lengths.quantile(0.5),
+            "view_to_cart": totals["cart_sessions"] / totals["view_sessions"] if totals["view_sessions"] else 0.0,
+            "cart_to_purchase": (totals["purchase_sessions"] / totals["cart_sessions"]
+                                 if totals["cart_sessions"] else 0.0),
+            "view_to_purchase": (totals["purchase_sessions"] / totals["view_sessions"]
+                                 if totals["view_sessions"] else 0.0),
+            "cart_abandonment": (totals["abandoned_sessions"] / totals["carted_sessions"]
+                                 if totals["carted_sessions"] else 0.0),
+        }
+        return self.summary
+
+    def print_report(self) -> None:
+        if self.summary is None:
+            self.run()
+        for key, value in self.summary.items():
+            print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+
+    @check_errors(on_off=True)
+    def persist(self, table_name: str = "session_funnel_daily") -> None:
+        """
+        Writes the daily funnel counters of the last run into a
+        table, one row per day, replacing the days already there.
+
+        Args:
+        table_name: str
+        """
+        if self.summary is None:
+            self.run()
+        rows = [
+            (date(1970, 1, 1) + timedelta(days=day),) + tuple(int(round(value)) for value in counters)
+            for day, counters in sorted(self.daily.items())
+        ]
+        with self.db.transaction():
+            self.db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table_name} (
+                    day DATE PRIMARY KEY,
+                    {', '.join(f'{counter} BIGINT NOT NULL' for counter in DAILY_COUNTERS)}
+                )
+            """)
+            self.db.execute_values(f"""
+                INSERT INTO {table_name} (day, {', '.join(DAILY_COUNTERS)}) VALUES %s
+                ON CONFLICT (day) DO UPDATE SET
+                {', '.join(f'{counter} = EXCLUDED.{counter}' for counter in DAILY_COUNTERS)}
+            """, rows)
+        print(f"{len(rows)} days written to {table_name}")
@@ -0,0 +1,280 @@
+import os
+import gzip
+import json
+import threading
+
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from warehouse.database_connection import DatabaseConnection
+from warehouse.utils import check_errors, timing_decorator
+
+FORMATS = {"csv": ".csv.gz", "parquet": ".parquet"}
+
+
+class TableExporter:
+    """
+    A class that exports a table to a directory of files, one per
+    slice of the table, with a manifest.json describing them. The
+    table is split by month of 'time_column' or by ranges of heap
+    pages (ctid), and every slice is streamed with COPY ... TO
+    STDOUT on its own connection, in parallel, straight into a
+    gzip compressed .csv or a .parquet file. All the slices read
+    the snapshot exported by the main connection, as pg_dump -j
+    does, so rows changed during the export are neither
+    duplicated nor missed across slices.
+
+    event_time has no index, so every month slice is a full
+    sequential scan of the table; ctid slices only read their
+    own pages.
+
+    Parquet files can then be read memory-mapped, for instance
+    with pd.read_parquet(path, memory_map=True), see read_export.
+
+    Attributes:
+    db: DatabaseConnection
+    table_name: str
+    output_dir: str
+    split: str
+    file_format: str
+    workers: int
+
+    Methods:
+    slices: list
+    export: dict
+    """
+    def __init__(self, db: DatabaseConnection, table_name: str, output_dir: str, split: str = "month",
+                 file_format: str = "csv", workers: int = 4, time_column: str = "event_time", ctid_slices: int = 16):
+        if split not in ("month", "ctid"):
+            raise ValueError("split must be 'month' or 'ctid'.")
+        if file_format not in FORMATS:
+            raise ValueError(f"file_format must be one of {list(FORMATS)}.")
+        self.db = db
+        self.table_name = table_name
+        self.output_dir = output_dir
+        self.split = split
+        self.file_format = file_format
+        self.workers = workers
+        self.time_column = time_column
+        self.ctid_slices = ctid_slices
+
+    def slices(self) -> list:
+        """
+        Returns the (name, WHERE clause) of every slice of the table.
+        Tables without 'time_column' are split by ctid.
+
+        Returns:
+        list of tuples
+        """
+        if self.split == "month" and self.time_column in self.db.get_columns(self.table_name):
+            months = self.db.execute(
+                f"SELECT DISTINCT date_trunc('month', {self.time_column}) FROM {self.table_name} "
+                f"WHERE {self.time_column} IS NOT NULL ORDER BY 1") or []
+            slices = [
+                (month.strftime("%Y_%m"),
+                 f"{self.time_column} >= '{month:%Y-%m-%d}' AND {self.time_column} < '{month:%Y-%m-%d}'::date + "
+                 f"INTERVAL '1 month'")
+                for (month,) in months
+            ]
+            slices.append(("no_time", f"{self.time_column} IS NULL"))
+            return slices
+
+        pages = self.db.execute(
+            f"SELECT pg_relation_size('{self.table_name}') / current_setting('block_size')::int")[0][0]
+        step = max(1, -(-pages // self.ctid_slices))
+        slices = []
+        for start in range(0, pages, step):
+            condition = f"ctid >= '({start},0)'::tid"
+            if start + step < pages:
+                condition += f" AND ctid < '({start + step},0)'::tid"
+            slices.append((f"pages_{start:010d}", condition))
+        return slices or [("pages_0000000000", "TRUE")]
+
+    def _copy_query(self, condition: str) -> str:
+        return f"COPY (SELECT * FROM {self.table_name} WHERE {condition}) TO STDOUT WITH CSV HEADER"
+
+    def _export_slice(self, name: str, condition: str, snapshot: str) -> dict:
+        """
+        Streams one slice into its file on a new connection that
+        reads the exported 'snapshot'.
+
+        Returns:
+        dict
+        """
+        path = os.path.join(self.output_dir, f"{self.table_name}_{name}{FORMATS[self.file_format]}")
+        with self.db.clone() as db, db.transaction():
+            db.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            db.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+            if self.file_format == "csv":
+                with gzip.open(path, "wt", encoding="utf-8", newline="") as file:
+                    db.cursor.copy_expert(self._copy_query(condition), file)
+                rows = db.cursor.rowcount
+            else:
+                rows = self._copy_to_parquet(db, condition, path)
+
+        if rows == 0:
+            if os.path.exists(path):
+                os.remove(path)
+            return None
+        return {"file": os.path.basename(path), "where": condition, "rows": rows, "bytes": os.path.getsize(path)}
+
+    def _copy_to_parquet(self, db: DatabaseConnection, condition: str, path: str) -> int:
+        """
+        Pipes the CSV output of COPY, from a background thread,
+        into a streaming CSV reader that writes Parquet row groups,
+        so the slice is never held in memory as a whole. If the
+        reader fails, the pipe is closed before waiting for the
+        COPY thread, so it cannot block on a full pipe, and the
+        error is raised. Only a slice without rows returns 0.
+
+        Returns:
+        int
+        """
+        try:
+            import pyarrow.csv as pa_csv
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Exporting to Parquet requires the pyarrow package: pip install pyarrow")
+
+        convert_options = pa_csv.ConvertOptions(
+            column_types=self._arrow_types(db),
+            true_values=["t"],
+            false_values=["f"],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        )
+
+        read_fd, write_fd = os.pipe()
+        errors = []
+
+        def copy():
+            try:
+                with os.fdopen(write_fd, "wb") as pipe:
+                    db.cursor.copy_expert(self._copy_query(condition), pipe)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=copy, daemon=True)
+        thread.start()
+        rows = 0
+        reader_error = None
+        pipe = os.fdopen(read_fd, "rb")
+        try:
+            reader = pa_csv.open_csv(pipe, convert_options=convert_options)
+            with pq.ParquetWriter(path, reader.schema, compression="zstd") as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+        except Exception as e:
+            reader_error = e
+        finally:
+            pipe.close()
+            thread.join()
+
+        copy_errors = [error for error in errors if not isinstance(error, BrokenPipeError)]
+        if copy_errors or reader_error:
+            if os.path.exists(path):
+                os.remove(path)
+            raise copy_errors[0] if copy_errors else reader_error
+        return rows
+
+    def _arrow_types(self, db: DatabaseConnection) -> dict:
+        """
+        Returns the Arrow type of every column from the table schema,
+        so the CSV reader does not infer types from the first block,
+        where sparse columns can be entirely empty. Types without an
+        exact Arrow equivalent (enums, UUIDs, unbounded NUMERIC...)
+        are exported as strings. COPY writes NULL as an unquoted
+        empty field and an empty string as "", which the reader is
+        told apart.
+
+        Args:
+        db: DatabaseConnection
+
+        Returns:
+        dict
+        """
+        import pyarrow as pa
+
+        simple_types = {
+            "smallint": pa.int16(),
+            "integer": pa.int32(),
+            "bigint": pa.int64(),
+            "real": pa.float32(),
+            "double precision": pa.float64(),
+            "boolean": pa.bool_(),
+            "date": pa.date32(),
+            "timestamp without time zone": pa.timestamp("us"),
+            "timestamp with time zone": pa.timestamp("us", tz="UTC"),
+        }
+        types = {}
+        for column, postgres_type in db.get_column_types(self.table_name).items():
+            if postgres_type in simple_types:
+                types[column] = simple_types[postgres_type]
+            elif postgres_type.startswith("numeric(") and "," in postgres_type:
+                precision, scale = (int(value) for value in postgres_type[len("numeric("):-1].split(","))
+                types[column] = pa.decimal128(precision, scale) if precision <= 38 else pa.string()
+            else:
+                types[column] = pa.string()
+        return types
+
+    @timing_decorator(msg="Exporting Table")
+    @check_errors(on_off=True)
+    def export(self) -> dict:
+        """
+        Exports every slice in parallel and writes the manifest. The
+        snapshot read by the slices stays valid while the exporting
+        transaction of the main connection is open.
+
+        Returns:
+        dict
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        with self.db.transaction():
+            self.db.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            snapshot = self.db.execute("SELECT pg_export_snapshot()")[0][0]
+            slices = self.slices()
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(lambda item: self._export_slice(*item, snapshot=snapshot), slices))
+
+        files = [result for result in results if result]
+        manifest = {
+            "table": self.table_name,
+            "split": self.split,
+            "format": self.file_format,
+            "columns": self.db.get_columns(self.table_name),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "rows": sum(file["rows"] for file in files),
+            "files": files,
+        }
+        with open(os.path.join(self.output_dir, "manifest.json"), "w") as file:
+            json.dump(manifest, file, indent=2)
+        print(f"Exported {manifest['rows']} rows of {self.table_name} into {len(files)} files in {self.output_dir}")
+        return manifest
+
+
+def read_export(output_dir: str):
+    """
+    Reads an export back as a single pandas DataFrame, following
+    its manifest. Parquet files are memory-mapped.
+
+    Args:
+    output_dir: str
+
+    Returns:
+    pd.DataFrame
+    """
+    import pandas as pd
+
+    with open(os.path.join(output_dir, "manifest.json")) as file:
+        manifest = json.load(file)
+    frames = []
+    for entry in manifest["files"]:
+        path = os.path.join(output_dir, entry["file"])
+        if manifest["format"] == "parquet":
+            frames.append(pd.read_parquet(path, memory_map=True))
+        else:
+            frames.append(pd.read_csv(path))
+    if not frames:
+        return pd.DataFrame(columns=manifest["columns"])
+    return pd.concat(frames, ignore_index=True)
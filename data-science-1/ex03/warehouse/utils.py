@@ -1,5 +1,24 @@
+import io
+import os
+import gzip
 import time
 import functools
+import threading
+
+from contextlib import contextmanager
+
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd"}
+CSV_TO_POSTGRES_TYPES = {
+    "event_time": "TIMESTAMP",
+    "event_type": "VARCHAR(255)",
+    "product_id": "INTEGER",
+    "price": "FLOAT",
+    "user_id": "INTEGER",
+    "user_session": "VARCHAR(255)",
+    "category_id": "BIGINT",
+    "category_code": "VARCHAR(255)",
+    "brand": "VARCHAR(255)",
+}
 
 
 def check_errors(on_off: bool = True) -> callable:
@@ -67,3 +86,84 @@ def write_to_file(filename: str, data: str, method: str = 'w') -> None:
         file.write(data)
         filesize = file.tell()
         print(f'File {filename} written, size in mb: {filesize / 1e6:.2f}')
+
+
+def get_compression(filename: str) -> str or None:
+    """
+    Returns the compression of a file from its extension,
+    'gzip', 'zstd' or None for a plain file.
+
+    Args:
+    filename: str
+
+    Returns:
+    str or None
+    """
+    return COMPRESSIONS.get(os.path.splitext(filename)[1])
+
+
+def open_binary(filename: str):
+    """
+    Opens a file for reading, decompressing it on the fly when
+    it is gzip or zstd compressed. The zstd stream reader is
+    buffered so that, like the others, it supports readline and
+    iteration over lines.
+
+    Args:
+    filename: str
+
+    Returns:
+    binary file object
+    """
+    compression = get_compression(filename)
+    if compression == "gzip":
+        return gzip.open(filename, 'rb')
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('Reading .zst files requires the zstandard package: pip install zstandard')
+        reader = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True)
+        return io.BufferedReader(reader)
+    return open(filename, 'rb')
+
+
+@contextmanager
+def open_decompressed(filename: str, chunk_size: int = 1 << 20):
+    """
+    Yields a binary file object with the decompressed contents of
+    a file. Compressed files are decompressed by a background
+    thread that feeds a pipe, so the reader (for instance COPY)
+    never waits for the whole file nor needs a decompressed copy
+    on disk. Errors of the background thread are raised when the
+    block exits.
+
+    Args:
+    filename: str
+    chunk_size: int
+    """
+    if not get_compression(filename):
+        with open(filename, 'rb') as file:
+            yield file
+        return
+
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def decompress():
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe, open_binary(filename) as source:
+                for chunk in iter(lambda: source.read(chunk_size), b''):
+                    pipe.write(chunk)
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=decompress, daemon=True)
+    thread.start()
+    with os.fdopen(read_fd, 'rb') as reader:
+        yield reader
+    thread.join()
+    if errors:
+        raise errors[0]
@@ -1,4 +1,5 @@
 import os
+import sys
 
 
 def main():
@@ -70,7 +71,10 @@ Press Any Key to Continue""")
     response = input()
     os.system("clear")
     if response == "y":
-        os.system("python3 data-science-1/ex03/warehouse/main.py")
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ex03"))
+        from warehouse.main import main as run_warehouse
+
+        run_warehouse()
     else:
         print("Goodbye")
 
@@ -1,8 +1,5 @@
 
-import os
-import dotenv
-
-from warehouse.database_connection import DatabaseConnection
+from warehouse.backends import connect_from_env
 from warehouse.utils import check_errors
 import matplotlib.pyplot as plt
 
@@ -27,14 +24,7 @@ def main():
     """
     Connect to the database and display a pie chart of the event types.
     """
-    dotenv.load_dotenv()
-    with DatabaseConnection(
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
-            name=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-    ) as db:
+    with connect_from_env() as db:
         customer = 'customer'
         event_types = db.execute(f"SELECT event_type, COUNT(*) FROM {customer} GROUP BY event_type;")
         event_types = dict(event_types)
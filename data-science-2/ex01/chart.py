@@ -1,15 +1,16 @@
-import os
-import dotenv
-
 import matplotlib.pyplot as plt
 
+from typing import TYPE_CHECKING
 from datetime import datetime
 from matplotlib.dates import MonthLocator, DayLocator, DateFormatter
 
-from warehouse.database_connection import DatabaseConnection
+from warehouse.backends import connect_from_env
+
+if TYPE_CHECKING:
+    from warehouse.database_connection import DatabaseConnection
 
 
-def display_line_graph(start_date: datetime, end_date: datetime, db: DatabaseConnection) -> None:
+def display_line_graph(start_date: datetime, end_date: datetime, db: 'DatabaseConnection') -> None:
     """
     Connects to the database and retrieves the data.
     Displays a line graph of the number of customers per month
@@ -39,7 +40,7 @@ def display_line_graph(start_date: datetime, end_date: datetime, db: DatabaseCon
     plt.show()
 
 
-def display_bar_graph(start_date: datetime, end_date: datetime, db: DatabaseConnection) -> None:
+def display_bar_graph(start_date: datetime, end_date: datetime, db: 'DatabaseConnection') -> None:
     """
     Connects to the database and retrieves the data.
     Displays a bar graph of the total sales in millions of dollars per month
@@ -80,7 +81,7 @@ def display_bar_graph(start_date: datetime, end_date: datetime, db: DatabaseConn
     plt.show()
 
 
-def display_filled_line_graph(start_date: datetime, end_date: datetime, db: DatabaseConnection) -> None:
+def display_filled_line_graph(start_date: datetime, end_date: datetime, db: 'DatabaseConnection') -> None:
     """
     Connects to the database and retrieves the data.
     Displays a filled line graph of the average spending per customer in dollars per month
@@ -129,14 +130,7 @@ def main():
     Keeps only the "purchase" data of "event_type" column.
     Then creates 3 charts from the beginning of October 2022 to the end of February 2023.
     """
-    dotenv.load_dotenv()
-    with DatabaseConnection(
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
-            name=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-    ) as db:
+    with connect_from_env() as db:
         start_date = datetime(2022, 10, 1)
         end_date = datetime(2023, 3, 1)
         display_line_graph(start_date, end_date, db)
@@ -1,13 +1,14 @@
-import os
-import dotenv
-
 import matplotlib.pyplot as plt
 import numpy as np
 
+from typing import TYPE_CHECKING
 from datetime import datetime
 from matplotlib.dates import MonthLocator, DayLocator, DateFormatter
 
-from warehouse.database_connection import DatabaseConnection
+from warehouse.backends import connect_from_env
+
+if TYPE_CHECKING:
+    from warehouse.database_connection import DatabaseConnection
 
 
 def get_stats(prices: list) -> dict:
@@ -79,7 +80,7 @@ def box_plot_by_quartiles(list_of_price_quartiles: list) -> None:
     plt.show()
 
 
-def make_box_plot(start_date: datetime, end_date: datetime, db: DatabaseConnection) -> None:
+def make_box_plot(start_date: datetime, end_date: datetime, db: 'DatabaseConnection') -> None:
     """
     Connects to the database and retrieves the data.
     Displays a box plot of the price of the items purchased
@@ -107,14 +108,7 @@ def main():
     Connects to the database and retrieves the data.
     Displays a box plot of the price of the items purchased
     """
-    dotenv.load_dotenv()
-    with DatabaseConnection(
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
-            name=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-    ) as db:
+    with connect_from_env() as db:
         start_date = datetime(2022, 10, 1)
         end_date = datetime(2023, 3, 1)
         make_box_plot(start_date, end_date, db)
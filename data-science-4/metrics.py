@@ -0,0 +1,244 @@
+import os
+import mmap
+import sys
+
+import numpy as np
+
+
+class LabelReader:
+    """
+    A class that streams the labels of a text file (one label
+    per line, spaces and blank lines included) as NumPy arrays. The file is memory-mapped and
+    cut into byte ranges that end on a line boundary, so
+    files larger than the available memory can be read.
+
+    Attributes:
+    path: str
+    chunk_bytes: int
+
+    Methods:
+    chunks: generator
+    read: np.ndarray
+    """
+    def __init__(self, path: str, chunk_bytes: int = 1 << 24):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'The file {path} does not exist.')
+        if chunk_bytes <= 0:
+            raise ValueError('chunk_bytes must be a positive integer.')
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+
+    def chunks(self):
+        """
+        Yields the labels of the file as arrays of strings.
+
+        Returns:
+        generator of np.ndarray
+        """
+        if os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            size = len(mm)
+            while start < size:
+                end = min(start + self.chunk_bytes, size)
+                if end < size:
+                    newline = mm.find(b'\n', end)
+                    end = size if newline == -1 else newline + 1
+                text = mm[start:end].decode()
+                lines = [line.rstrip('\r') for line in text.removesuffix('\n').split('\n')]
+                yield np.array(lines)
+                start = end
+
+    def read(self) -> np.ndarray:
+        """
+        Reads every label of the file into a single array.
+
+        Returns:
+        np.ndarray
+        """
+        chunks = list(self.chunks())
+        return np.concatenate(chunks) if chunks else np.array([], dtype=str)
+
+
+def rechunk(chunks, size: int):
+    """
+    Regroups a stream of arrays into arrays of exactly 'size'
+    elements (the last one may be shorter).
+
+    Args:
+    chunks: iterable of np.ndarray
+    size: int
+
+    Returns:
+    generator of np.ndarray
+    """
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered < size:
+            continue
+        merged = np.concatenate(buffer)
+        cut = len(merged) - len(merged) % size
+        for start in range(0, cut, size):
+            yield merged[start:start + size]
+        buffer = [merged[cut:]]
+        buffered = len(merged) - cut
+    if buffered:
+        yield np.concatenate(buffer)
+
+
+class ConfusionMatrix:
+    """
+    A class that accumulates a confusion matrix chunk by chunk
+    and derives the per class metrics from it. Rows are the
+    true labels and columns the predicted labels.
+
+    Attributes:
+    classes: list
+    matrix: np.ndarray
+
+    Methods:
+    update: None
+    metrics: dict
+    accuracy: float
+    print_report: None
+    """
+    def __init__(self):
+        self._index = {}
+        self.classes = []
+        self.matrix = np.zeros((0, 0), dtype=np.int64)
+
+    def _encode(self, labels: np.ndarray) -> np.ndarray:
+        """
+        Maps an array of labels to integer class ids, registering
+        the labels that were never seen before.
+
+        Args:
+        labels: np.ndarray
+
+        Returns:
+        np.ndarray
+        """
+        uniques, inverse = np.unique(labels, return_inverse=True)
+        for label in uniques.tolist():
+            if label not in self._index:
+                self._index[label] = len(self.classes)
+                self.classes.append(label)
+        ids = np.array([self._index[label] for label in uniques.tolist()], dtype=np.int64)
+        return ids[inverse.reshape(-1)]
+
+    def update(self, truth: np.ndarray, predictions: np.ndarray) -> None:
+        """
+        Adds a chunk of true and predicted labels to the matrix.
+
+        Args:
+        truth: np.ndarray
+        predictions: np.ndarray
+        """
+        if len(truth) != len(predictions):
+            raise ValueError(f'Truth and predictions differ in length: {len(truth)} != {len(predictions)}.')
+        truth_ids = self._encode(truth)
+        prediction_ids = self._encode(predictions)
+
+        n = len(self.classes)
+        if self.matrix.shape[0] < n:
+            grown = np.zeros((n, n), dtype=np.int64)
+            grown[:self.matrix.shape[0], :self.matrix.shape[1]] = self.matrix
+            self.matrix = grown
+
+        counts = np.bincount(truth_ids * n + prediction_ids, minlength=n * n)
+        self.matrix += counts.reshape(n, n)
+
+    @property
+    def total(self) -> int:
+        return int(self.matrix.sum())
+
+    def accuracy(self) -> float:
+        """
+        Returns the share of labels predicted correctly.
+
+        Returns:
+        float
+        """
+        return float(np.trace(self.matrix) / self.total) if self.total else 0.0
+
+    def metrics(self) -> dict:
+        """
+        Returns precision, recall, f1-score, accuracy and support
+        of every class, computed at once over the whole matrix.
+
+        Returns:
+        dict
+        """
+        tp = np.diag(self.matrix).astype(np.float64)
+        predicted = self.matrix.sum(axis=0)
+        support = self.matrix.sum(axis=1)
+        tn = self.total - predicted - support + tp
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(predicted > 0, tp / predicted, 0.0)
+            recall = np.where(support > 0, tp / support, 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+            accuracy = np.where(self.total > 0, (tp + tn) / self.total, 0.0)
+
+        return {
+            label: {
+                "precision": float(precision[i]),
+                "recall": float(recall[i]),
+                "f1-score": float(f1[i]),
+                "accuracy": float(accuracy[i]),
+                "total": int(support[i]),
+            }
+            for i, label in enumerate(self.classes)
+        }
+
+    def print_report(self) -> None:
+        print(f"{'':>12}{'precision':>12}{'recall':>12}{'f1-score':>12}{'total':>12}")
+        for label, values in self.metrics().items():
+            print(f"{label:>12}{values['precision']:>12.2f}{values['recall']:>12.2f}"
+                  f"{values['f1-score']:>12.2f}{values['total']:>12}")
+        print(f"\n{'accuracy':>12}{'':>36}{self.accuracy():>12.2f}{self.total:>12}")
+        print(f"\n{self.matrix}")
+
+
+def evaluate(truth_path: str, predictions_path: str, chunk_lines: int = 1 << 20) -> ConfusionMatrix:
+    """
+    Streams both label files in lockstep and accumulates their
+    confusion matrix 'chunk_lines' labels at a time.
+
+    Args:
+    truth_path: str
+    predictions_path: str
+    chunk_lines: int
+
+    Returns:
+    ConfusionMatrix
+    """
+    confusion = ConfusionMatrix()
+    truth_chunks = rechunk(LabelReader(truth_path).chunks(), chunk_lines)
+    prediction_chunks = rechunk(LabelReader(predictions_path).chunks(), chunk_lines)
+    for truth in truth_chunks:
+        predictions = next(prediction_chunks, np.array([], dtype=str))
+        confusion.update(truth, predictions)
+    if next(prediction_chunks, None) is not None:
+        raise ValueError('There are more predictions than true labels.')
+    return confusion
+
+
+def main():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    predictions_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(directory, 'predictions.txt')
+    truth_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(directory, 'truth.txt')
+    evaluate(truth_path, predictions_path).print_report()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(e)
+        sys.exit(1)
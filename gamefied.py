@@ -42,7 +42,12 @@ if __name__ == "__main__":
     os.system("clear")
 
     if 1 <= module <= 4:
-        os.system(f'python3 ./data-science-{module}/main.py')
+        import launcher
+
+        try:
+            launcher.main(["module", str(module)])
+        except Exception as e:
+            print(e)
     else:
         print("Invalid module selection. Please select a module between 1 and 5.")
 
@@ -0,0 +1,223 @@
+import os
+import sys
+import time
+import shlex
+import argparse
+import subprocess
+import importlib.util
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+WAREHOUSE = os.path.join(ROOT, "data-science-1", "ex03")
+CHARTS = {
+    "pie": os.path.join(ROOT, "data-science-2", "ex00", "pie.py"),
+    "chart": os.path.join(ROOT, "data-science-2", "ex01", "chart.py"),
+    "mustache": os.path.join(ROOT, "data-science-2", "ex02", "mustache.py"),
+}
+METRICS = os.path.join(ROOT, "data-science-4", "metrics.py")
+
+COMMANDS = {}
+
+
+def command(name: str, help: str = None, imports: tuple = ()) -> callable:
+    """
+    A decorator to register a function as a launcher subcommand.
+    The function receives the parsed arguments and must import
+    its heavy dependencies itself, so that starting the launcher
+    only costs the imports of the command that is run. 'imports'
+    lists those modules, for bench to measure their cost.
+
+    Args:
+    name: str
+    help: str
+    imports: tuple
+    """
+
+    def decorator(func: callable) -> callable:
+        COMMANDS[name] = (func, help or func.__doc__, tuple(imports))
+        return func
+
+    return decorator
+
+
+def load_script(path: str):
+    """
+    Imports a script by its path, in the current interpreter.
+
+    Args:
+    path: str
+
+    Returns:
+    module
+    """
+    if WAREHOUSE not in sys.path:
+        sys.path.insert(0, WAREHOUSE)
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_warehouse_stage(*stages: str) -> None:
+    if WAREHOUSE not in sys.path:
+        sys.path.insert(0, WAREHOUSE)
+    from warehouse import main as warehouse
+
+    with warehouse.connect() as db:
+        for stage in stages:
+            getattr(warehouse, stage)(db)
+
+
+@command("ingest", help="Load the CSV directory and merge the customer table", imports=("warehouse.main",))
+def ingest(args) -> None:
+    run_warehouse_stage("ingest")
+
+
+@command("dedup", help="Remove the duplicate rows of the customer table", imports=("warehouse.main",))
+def dedup(args) -> None:
+    run_warehouse_stage("dedup")
+
+
+@command("dedup-preview", help="Report near-duplicates of the source files: dedup-preview [DIR] [TOLERANCE] [KEYS...]",
+         imports=("dotenv", "pandas", "warehouse.duplicate_analyzer"))
+def dedup_preview(args) -> None:
+    directory = args.args[0] if args.args else None
+    tolerance = float(args.args[1]) if len(args.args) > 1 else 1.0
+    keys = args.args[2:]
+
+    if WAREHOUSE not in sys.path:
+        sys.path.insert(0, WAREHOUSE)
+    import dotenv
+    from warehouse.duplicate_analyzer import DuplicateAnalyzer, DEFAULT_KEYS
+
+    dotenv.load_dotenv()
+    analyzer = DuplicateAnalyzer(keys=keys or DEFAULT_KEYS, tolerance=tolerance)
+    analyzer.analyze_directory(directory or os.getenv("CSV_DIRECTORY"))
+    analyzer.print_report()
+
+
+@command("fuse", help="Compact the item table and join it to the customer table", imports=("warehouse.main",))
+def fuse(args) -> None:
+    run_warehouse_stage("fuse")
+
+
+@command("features", help="Update the per-customer feature table", imports=("warehouse.main",))
+def features(args) -> None:
+    run_warehouse_stage("features")
+
+
+@command("funnel", help="Compute the session funnel and store its daily counters", imports=("warehouse.main",))
+def funnel(args) -> None:
+    run_warehouse_stage("funnel")
+
+
+@command("warehouse", help="Run ingest, dedup, fuse and features in a row", imports=("warehouse.main",))
+def warehouse(args) -> None:
+    run_warehouse_stage("ingest", "dedup", "fuse", "features")
+
+
+@command("export", help="Export a table to files: export TABLE [OUTPUT_DIR] [month|ctid] [csv|parquet]",
+         imports=("warehouse.main", "warehouse.table_export"))
+def export(args) -> None:
+    if not args.args:
+        raise ValueError("Please provide the table to export.")
+    table_name, *options = args.args
+    output_dir = options[0] if len(options) > 0 else os.path.join("exports", table_name)
+    split = options[1] if len(options) > 1 else "month"
+    file_format = options[2] if len(options) > 2 else "csv"
+
+    if WAREHOUSE not in sys.path:
+        sys.path.insert(0, WAREHOUSE)
+    from warehouse.main import connect
+    from warehouse.table_export import TableExporter
+
+    with connect() as db:
+        TableExporter(db, table_name, output_dir, split=split, file_format=file_format).export()
+
+
+@command("charts", help="Display the charts of data-science-2 (pie, chart, mustache)",
+         imports=("numpy", "matplotlib.pyplot", "warehouse.backends", "warehouse.database_connection"))
+def charts(args) -> None:
+    names = args.args or list(CHARTS)
+    for name in names:
+        if name not in CHARTS:
+            raise ValueError(f"Unknown chart {name}, choose from {list(CHARTS)}.")
+        load_script(CHARTS[name]).main()
+
+
+@command("metrics", help="Print the classification metrics of data-science-4", imports=("numpy",))
+def metrics(args) -> None:
+    module = load_script(METRICS)
+    sys.argv = [METRICS] + args.args
+    module.main()
+
+
+@command("module", help="Run the introduction script of a module (1-4)")
+def module(args) -> None:
+    number = args.args[0] if args.args else "1"
+    path = os.path.join(ROOT, f"data-science-{number}", "main.py")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Module {number} has no main.py yet.")
+    load_script(path).main()
+
+
+@command("bench", help="Time commands run directly and through the launcher, and the import cost of every "
+                        "subcommand: bench [RUNS]")
+def bench(args) -> None:
+    runs = int(args.args[0]) if args.args else 5
+    launcher = [sys.executable, os.path.abspath(__file__)]
+
+    def measure(cmd: list) -> float:
+        best = float("inf")
+        for _ in range(runs):
+            start_time = time.perf_counter()
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            best = min(best, time.perf_counter() - start_time)
+        if result.returncode:
+            print(f"Warning: {' '.join(cmd)} exited with code {result.returncode}")
+        return best
+
+    script = [sys.executable, METRICS]
+    comparisons = [
+        ("metrics.py run directly", script, launcher + ["metrics"]),
+        ("metrics.py through os.system", [sys.executable, "-c", f"import os; os.system({shlex.join(script)!r})"],
+         launcher + ["metrics"]),
+    ]
+    print("Same command, old way -> launcher:")
+    for name, old, new in comparisons:
+        old_time, new_time = measure(old), measure(new)
+        print(f"  {name}: {old_time * 1000:.1f} ms -> {new_time * 1000:.1f} ms")
+
+    baseline = measure([sys.executable, "-c", "pass"])
+
+    def import_cost(modules) -> float:
+        code = f"import sys; sys.path.insert(0, {WAREHOUSE!r}); " + "; ".join(f"import {m}" for m in modules)
+        return max(measure([sys.executable, "-c", code]) - baseline, 0.0)
+
+    print(f"Interpreter startup: {baseline * 1000:.1f} ms")
+    print(f"Launcher startup (--help): {max(measure(launcher + ['--help']) - baseline, 0.0) * 1000:.1f} ms")
+    print("Import cost per subcommand:")
+    all_imports = []
+    for name, (_, _, imports) in COMMANDS.items():
+        if imports:
+            print(f"  {name}: {import_cost(imports) * 1000:.1f} ms")
+            all_imports += [module for module in imports if module not in all_imports]
+    print(f"Every subcommand imported eagerly: {import_cost(all_imports) * 1000:.1f} ms")
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description="Piscine Data Science launcher")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text, _) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("args", nargs="*")
+    args = parser.parse_args(argv)
+    COMMANDS[args.command][0](args)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(e)
+        sys.exit(1)